@@ -0,0 +1,124 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Persistent raw Ethernet transport for SwitchML frames
+
+    One AF_PACKET socket is opened per AllReduce and bound to the SwitchML
+    EtherType. A classic BPF program attached to it lets the kernel discard
+    everything but SwitchML results, so the worker never sees its own
+    outgoing data frames or unrelated traffic. Frames are built into and
+    parsed from preallocated buffers with struct.pack_into/unpack_from.
+"""
+
+import ctypes
+import socket
+import struct
+import time
+
+TYPE_SWITCHML = 0x1234  # Custom EtherType for SwitchML
+
+ETH_HEADER = struct.Struct('!6s6sH')
+SWITCHML = struct.Struct('!BBBBIIII')   # worker_id, chunk_id, num_workers, flags, value0-3
+FRAME_SIZE = ETH_HEADER.size + SWITCHML.size
+
+_FLAGS_OFFSET = ETH_HEADER.size + 3
+_SO_ATTACH_FILTER = getattr(socket, 'SO_ATTACH_FILTER', 26)
+
+def _bpf_results_only(ethertype):
+    """
+    Classic BPF program accepting only frames with EtherType `ethertype`
+    and SwitchML flags == 1 (results):
+        ldh [12];  jeq #ethertype, next, drop
+        ldb [17];  jeq #1, accept, drop
+        accept: ret #0xffff
+        drop:   ret #0
+    """
+    insn = struct.Struct('=HBBI')   # struct sock_filter { code, jt, jf, k }
+    BPF_LD_H_ABS, BPF_LD_B_ABS, BPF_JEQ_K, BPF_RET_K = 0x28, 0x30, 0x15, 0x06
+    return b''.join([
+        insn.pack(BPF_LD_H_ABS, 0, 0, 12),
+        insn.pack(BPF_JEQ_K, 0, 3, ethertype),
+        insn.pack(BPF_LD_B_ABS, 0, 0, _FLAGS_OFFSET),
+        insn.pack(BPF_JEQ_K, 0, 1, 1),
+        insn.pack(BPF_RET_K, 0, 0, 0xffff),
+        insn.pack(BPF_RET_K, 0, 0, 0),
+    ])
+
+class EthTransport:
+    """
+    Raw socket transport for SwitchML over Ethernet
+
+    :param str iface: the interface to send and receive on
+    :param str dst_mac: destination MAC of outgoing frames
+    """
+
+    def __init__(self, iface, dst_mac, ethertype=TYPE_SWITCHML):
+        # Protocol 0 receives nothing until bind(), so the filter is in place
+        # before the first frame is queued
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+
+        # Keep the program alive for as long as the socket: the kernel copies
+        # it on attach, but the fprog must point at valid memory meanwhile
+        self._bpf = ctypes.create_string_buffer(_bpf_results_only(ethertype))
+        fprog = struct.pack('HL', len(self._bpf.raw) // 8, ctypes.addressof(self._bpf))
+        self.sock.setsockopt(socket.SOL_SOCKET, _SO_ATTACH_FILTER, fprog)
+        self.sock.bind((iface, ethertype))
+
+        self.mac = self.sock.getsockname()[4]
+        self.tx = bytearray(FRAME_SIZE)
+        self.rx = bytearray(2048)
+        ETH_HEADER.pack_into(self.tx, 0, bytes.fromhex(dst_mac.replace(':', '')), self.mac, ethertype)
+
+    def mac_str(self):
+        """ This interface's MAC address as a string """
+        return ':'.join('%02x' % b for b in self.mac)
+
+    def send(self, worker_id, chunk_id, num_workers, flags, values):
+        """ Send one SwitchML frame carrying (up to) four values """
+        v = values
+        n = len(v)
+        SWITCHML.pack_into(self.tx, ETH_HEADER.size, worker_id, chunk_id, num_workers, flags,
+                           v[0] if n > 0 else 0, v[1] if n > 1 else 0,
+                           v[2] if n > 2 else 0, v[3] if n > 3 else 0)
+        return self.sock.send(self.tx)
+
+    def recv(self, timeout):
+        """
+        Wait up to `timeout` seconds for one SwitchML result frame
+        Returns (worker_id, chunk_id, num_workers, flags, value0, .., value3),
+        or None on timeout
+        """
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            self.sock.settimeout(remaining)
+            try:
+                n = self.sock.recv_into(self.rx)
+            except socket.timeout:
+                return None
+            if n >= FRAME_SIZE:
+                return SWITCHML.unpack_from(self.rx, ETH_HEADER.size)
+
+    def close(self):
+        self.sock.close()
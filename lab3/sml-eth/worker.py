@@ -22,31 +22,13 @@
 from lib.gen import GenInts, GenMultipleOfInRange
 from lib.test import CreateTestData, RunIntTest
 from lib.worker import *
-from scapy.all import *
-import random
+from lib.transport import EthTransport
 import time
 
 NUM_ITER   = 1     # TODO: Make sure your program can handle larger values
 CHUNK_SIZE = 4     # Number of 32-bit values per chunk
 
-# Constants
-TYPE_SWITCHML = 0x1234  # Custom EtherType for SwitchML
-
-class SwitchML(Packet):
-    name = "SwitchMLPacket"
-    fields_desc = [
-        ByteField("worker_id", 0),      # Worker rank
-        ByteField("chunk_id", 0),       # Chunk identifier within vector
-        ByteField("num_workers", 0),    # Total number of workers
-        ByteField("flags", 0),          # Control flags (0=data, 1=result)
-        IntField("value0", 0),          # First value in chunk
-        IntField("value1", 0),          # Second value in chunk
-        IntField("value2", 0),          # Third value in chunk
-        IntField("value3", 0)           # Fourth value in chunk
-    ]
-
-# Bind the custom header to Ethernet
-bind_layers(Ether, SwitchML, type=TYPE_SWITCHML)
+RECV_TIMEOUT = 10  # Seconds to wait for the result of a chunk
 
 def AllReduce(iface, rank, data, result):
     """
@@ -59,86 +41,52 @@ def AllReduce(iface, rank, data, result):
 
     This function is blocking, i.e. only returns with a result or error
     """
-    Log(f"Worker {rank}: Starting AllReduce on {len(data)} elements")
+    Log("Worker %s: Starting AllReduce on %s elements", rank, len(data))
 
     # Get network information
-    my_mac = get_if_hwaddr(iface)
     switch_mac = "ff:ff:ff:ff:ff:ff"  # Use broadcast MAC for now
     num_workers = 3  # This should match NUM_WORKERS in network.py
 
-    # Process data in chunks
-    result_idx = 0
-    for chunk_start in range(0, len(data), CHUNK_SIZE):
-        chunk_id = chunk_start // CHUNK_SIZE
-        chunk_data = data[chunk_start:chunk_start + CHUNK_SIZE]
-
-        # Pad chunk to exactly CHUNK_SIZE elements
-        while len(chunk_data) < CHUNK_SIZE:
-            chunk_data.append(0)
-
-        Log(f"Worker {rank}: Sending chunk {chunk_id} with values {chunk_data[:len(data[chunk_start:chunk_start + CHUNK_SIZE])]}")
-        Log(f"Worker {rank}: Using src_mac={my_mac}, dst_mac={switch_mac}, ethertype=0x{TYPE_SWITCHML:04x}")
-
-        # Create and send SwitchML packet
-        pkt = Ether(dst=switch_mac, src=my_mac, type=TYPE_SWITCHML) / \
-              SwitchML(
-                  worker_id=rank,
-                  chunk_id=chunk_id,
-                  num_workers=num_workers,
-                  flags=0,  # Data packet
-                  value0=chunk_data[0],
-                  value1=chunk_data[1],
-                  value2=chunk_data[2],
-                  value3=chunk_data[3]
-              )
-
-        # Debug: Show the actual packet bytes
-        Log(f"Worker {rank}: Packet summary: {pkt.summary()}")
-        Log(f"Worker {rank}: Packet length: {len(pkt)} bytes")
-        Log(f"Worker {rank}: EtherType in packet: 0x{pkt[Ether].type:04x}")
-
-        sendp(pkt, iface=iface, verbose=False)
-        Log(f"Worker {rank}: Packet sent")
-
-        # Add small random delay to avoid packet collisions
-        time.sleep(random.uniform(0.001, 0.005))
-
-        # Wait for aggregation result
-        def packet_filter(pkt):
-            if pkt.haslayer(SwitchML):
-                Log(f"Worker {rank}: Received SwitchML packet - chunk_id={pkt[SwitchML].chunk_id}, flags={pkt[SwitchML].flags}, expected_chunk={chunk_id}")
-                return (pkt[SwitchML].chunk_id == chunk_id and pkt[SwitchML].flags == 1)
-            return False
-
-        Log(f"Worker {rank}: Waiting for response to chunk {chunk_id}")
-
-        # Sniff for response packet with timeout
-        pkts = sniff(iface=iface, lfilter=packet_filter, count=1, timeout=10)
-
-        if pkts:
-            response_pkt = pkts[0]
-            chunk_result = [
-                response_pkt[SwitchML].value0,
-                response_pkt[SwitchML].value1,
-                response_pkt[SwitchML].value2,
-                response_pkt[SwitchML].value3
-            ]
-
-            Log(f"Worker {rank}: Received response for chunk {chunk_id}: {chunk_result}")
+    # One socket for the whole AllReduce, filtered in the kernel
+    try:
+        transport = EthTransport(iface, switch_mac)
+    except Exception as e:
+        LogError("Worker %s: ERROR - Could not create raw socket on %s: %s", rank, iface, e)
+        return False
+    Log("Worker %s: Using src_mac=%s, dst_mac=%s", rank, transport.mac_str(), switch_mac)
+
+    try:
+        # Process data in chunks
+        for chunk_start in range(0, len(data), CHUNK_SIZE):
+            # chunk_id is 8 bits. Waiting for each result before the next
+            # chunk means the switch has freed a slot before it is reused
+            chunk_id = (chunk_start // CHUNK_SIZE) % 256
+            chunk_data = data[chunk_start:chunk_start + CHUNK_SIZE]
+
+            LogDebug("Worker %s: Sending chunk %s with values %s", rank, chunk_id, chunk_data)
+            transport.send(rank, chunk_id, num_workers, 0, chunk_data)
+
+            # Wait for aggregation result, skipping results of other chunks
+            deadline = time.time() + RECV_TIMEOUT
+            response = None
+            while response is None:
+                response = transport.recv(deadline - time.time())
+                if response is None:
+                    LogError("Worker %s: ERROR - Timeout waiting for chunk %s", rank, chunk_id)
+                    return False
+                if response[1] != chunk_id:
+                    LogDebug("Worker %s: Ignoring result for chunk %s, expected %s", rank, response[1], chunk_id)
+                    response = None
+
+            chunk_result = response[4:]
+            LogDebug("Worker %s: Received response for chunk %s: %s", rank, chunk_id, chunk_result)
 
             # Copy result values to output (only up to remaining elements)
-            remaining_elements = len(data) - chunk_start
-            elements_to_copy = min(CHUNK_SIZE, remaining_elements)
+            result[chunk_start:chunk_start + len(chunk_data)] = chunk_result[:len(chunk_data)]
+    finally:
+        transport.close()
 
-            for i in range(elements_to_copy):
-                if result_idx < len(result):
-                    result[result_idx] = chunk_result[i]
-                    result_idx += 1
-        else:
-            Log(f"Worker {rank}: ERROR - Timeout waiting for chunk {chunk_id}")
-            return False
-
-    Log(f"Worker {rank}: AllReduce completed successfully")
+    Log("Worker %s: AllReduce completed successfully", rank)
     return True
 
 def main():
@@ -154,7 +102,8 @@ def main():
         if success:
             RunIntTest("eth-iter-%d" % i, rank, data_in, True)
         else:
-            Log("AllReduce failed!")
+            LogError("AllReduce failed!")
+            DumpLog()
     Log("Done")
 
 if __name__ == '__main__':
@@ -0,0 +1,292 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Per-chunk latency of the Level 3 AllReduce as the aggregation group grows
+
+    Run it on every worker instead of worker.py, from the Mininet CLI:
+
+        mininet> py net.run_workers('bench.py')
+
+    Every worker writes the latency of each chunk (first send to result) to
+    $APP_LOGS/bench-n<group size>-j<job>-w<rank>.json. Restart network.py with
+    APP_NUM_WORKERS=2, 4, 8, 16, 32, 64 and run the benchmark for each size,
+    then summarize all runs with
+
+        python bench.py --report logs/
+
+    --slow-rank and --slow-ms inject a straggler that starts every call late,
+    to compare the p99 time per call with and without APP_QUORUM or
+    APP_DEADLINE_US (see network.py).
+
+    With --density, the sparse AllReduce is measured instead: every worker
+    fills that fraction of its blocks, and the time, packets and payload
+    bytes per call and the density of the union of all workers' blocks go
+    to $APP_LOGS/bench-sparse-d<density>-n<group size>-j<job>-w<rank>.json,
+    e.g. for --density 0.01, 0.1 and 0.5. The blocks are drawn independently
+    per worker, so the union, which is what the workers send, grows with the
+    group size. With --transport ring, the host
+    ring's time per call goes to bench-ring-n<group size>-j<job>-w<rank>.json.
+
+    --logs writes the results somewhere else than $APP_LOGS. suite.py runs
+    the benchmark over sweeps of sizes and settings against model.py.
+"""
+
+from lib.worker import *
+from worker import CHUNK_SIZE, JOB_ID, NUM_WORKERS, open_endpoint, open_ring, allreduce_sparse
+from lib.codec import payload_size
+from lib import sparse
+import argparse
+import sys
+import asyncio
+import glob
+import json
+import numpy as np
+
+def percentiles(latency):
+    """ Summary of latencies given in seconds, in microseconds """
+    us = np.asarray(latency) * 1e6
+    return {'p50_us': float(np.percentile(us, 50)), 'p90_us': float(np.percentile(us, 90)),
+            'p99_us': float(np.percentile(us, 99)), 'max_us': float(us.max())}
+
+def int_vector(elems, rng):
+    """ Random 16-bit input values, so that sums of up to 64K workers fit """
+    return rng.integers(0, 0xffff, elems, dtype=np.int64)
+
+async def measure(rank, elems, iters, warmup, window, delay=0):
+    """
+    Run warmup + iters AllReduce calls, each `delay` seconds late, and return
+    the latency of every chunk of the measured ones, the seconds per call, the
+    number of partial chunks and the retransmissions per call, or None if a
+    call failed
+    """
+    endpoint = await open_endpoint(rank)
+    rng = np.random.default_rng(rank)
+    result = np.zeros(elems, dtype=np.uint32)
+    latency, seconds, partial, retransmits = [], [], 0, []
+    try:
+        for i in range(warmup + iters):
+            data = int_vector(elems, rng)
+            sent = endpoint.packets_sent
+            start = endpoint.loop.time()
+            if delay:
+                await asyncio.sleep(delay)
+            handle = endpoint.allreduce(data, result, window)
+            if not await handle:
+                return None
+            if i >= warmup:
+                latency.extend(handle.latency)
+                seconds.append(endpoint.loop.time() - start)
+                partial += len(handle.partial)
+                retransmits.append(endpoint.packets_sent - sent - handle.num_chunks)
+    finally:
+        endpoint.close()
+    return latency, seconds, partial, retransmits
+
+async def measure_ring(rank, elems, iters, warmup):
+    """ Run warmup + iters ring AllReduce calls and return the seconds of every measured one """
+    ring = await open_ring(rank)
+    loop = asyncio.get_running_loop()
+    rng = np.random.default_rng(rank)
+    seconds = []
+    try:
+        for i in range(warmup + iters):
+            data = int_vector(elems, rng)
+            start = loop.time()
+            await ring.allreduce(data)
+            if i >= warmup:
+                seconds.append(loop.time() - start)
+    finally:
+        ring.close()
+    return seconds
+
+def sparse_vector(elems, density, rng):
+    """ A vector with `density` of its blocks of CHUNK_SIZE values filled """
+    data = np.zeros(elems, dtype=np.int64)
+    blocks = -(-elems // CHUNK_SIZE)
+    for b in rng.choice(blocks, round(density * blocks), replace=False):
+        block = data[b * CHUNK_SIZE:(b + 1) * CHUNK_SIZE]
+        block[:] = rng.integers(1, 0xffff, len(block))
+    return data
+
+async def measure_sparse(rank, elems, iters, warmup, window, density):
+    """
+    Run warmup + iters sparse AllReduce calls and return the seconds, packets,
+    payload bytes and union blocks of every measured one, or None if a call failed
+    """
+    endpoint = await open_endpoint(rank)
+    rng = np.random.default_rng(rank)
+    seconds, packets, sent_bytes, union = [], [], [], []
+    try:
+        for i in range(warmup + iters):
+            data = sparse_vector(elems, density, rng)
+            result = np.zeros(elems, dtype=np.uint32)
+            sent, sent_before = endpoint.packets_sent, endpoint.bytes_sent
+            start = endpoint.loop.time()
+            if not await allreduce_sparse(endpoint, data, result, window):
+                return None
+            if i >= warmup:
+                seconds.append(endpoint.loop.time() - start)
+                packets.append(endpoint.packets_sent - sent)
+                sent_bytes.append(endpoint.bytes_sent - sent_before)
+                # The filled values are positive, so a block of the union never sums to zero
+                union.append(len(sparse.union(sparse.presence(result, CHUNK_SIZE), elems, CHUNK_SIZE)))
+    finally:
+        endpoint.close()
+    return seconds, packets, sent_bytes, union
+
+def run_sparse(args):
+    rank = args.rank
+    Log("Worker %d: Benchmarking sparse AllReduce at density %g, %d elements x %d iterations",
+        rank, args.density, args.elems, args.iters)
+    measured = asyncio.run(measure_sparse(rank, args.elems, args.iters, args.warmup, args.window, args.density))
+    if measured is None:
+        LogError("Worker %d: Benchmark failed", rank)
+        DumpLog()
+        sys.exit(1)
+
+    seconds, packets, sent_bytes, union = measured
+    Log("Worker %d: %.1f packets, %.0f bytes and %.0fus per call", rank, np.mean(packets), np.mean(sent_bytes),
+        np.mean(seconds) * 1e6)
+    chunks = -(-args.elems // CHUNK_SIZE)
+    path = os.path.join(args.logs, 'bench-sparse-d%g-n%d-j%d-w%d.json' % (args.density, NUM_WORKERS, JOB_ID, rank))
+    with open(path, 'w') as f:
+        json.dump({'num_workers': NUM_WORKERS, 'job_id': JOB_ID, 'rank': rank, 'chunk_size': CHUNK_SIZE,
+                   'elems': args.elems, 'iters': args.iters, 'window': args.window, 'density': args.density,
+                   'dense_packets': chunks, 'dense_bytes': chunks * payload_size(0) + 4 * args.elems,
+                   'packets': packets, 'bytes': sent_bytes, 'union_density': [u / chunks for u in union],
+                   'call_us': [t * 1e6 for t in seconds]}, f)
+
+def run(args):
+    rank = args.rank
+    Log("Worker %d: Benchmarking %d workers, %d elements x %d iterations, window %d",
+        rank, NUM_WORKERS, args.elems, args.iters, args.window)
+    delay = args.slow_ms / 1000 if rank == args.slow_rank else 0
+    measured = asyncio.run(measure(rank, args.elems, args.iters, args.warmup, args.window, delay))
+    if measured is None:
+        LogError("Worker %d: Benchmark failed", rank)
+        DumpLog()
+        sys.exit(1)
+
+    latency, seconds, partial, retransmits = measured
+    stats = percentiles(latency)
+    Log("Worker %d: %d chunks, p50 %.0fus, p90 %.0fus, p99 %.0fus", rank, len(latency),
+        stats['p50_us'], stats['p90_us'], stats['p99_us'])
+
+    path = os.path.join(args.logs, 'bench-n%d-j%d-w%d.json' % (NUM_WORKERS, JOB_ID, rank))
+    with open(path, 'w') as f:
+        json.dump({'num_workers': NUM_WORKERS, 'job_id': JOB_ID, 'rank': rank, 'chunk_size': CHUNK_SIZE,
+                   'elems': args.elems, 'iters': args.iters, 'window': args.window,
+                   'slow_rank': args.slow_rank, 'slow_ms': args.slow_ms, 'partial_chunks': partial,
+                   'call_us': [t * 1e6 for t in seconds], 'retransmits': retransmits,
+                   'latency_us': [t * 1e6 for t in latency], **stats}, f)
+
+def run_ring(args):
+    rank = args.rank
+    Log("Worker %d: Benchmarking the ring of %d workers, %d elements x %d iterations",
+        rank, NUM_WORKERS, args.elems, args.iters)
+    try:
+        seconds = asyncio.run(measure_ring(rank, args.elems, args.iters, args.warmup))
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+        LogError("Worker %d: Benchmark failed: %r", rank, e)
+        DumpLog()
+        sys.exit(1)
+
+    Log("Worker %d: %.0fus per call", rank, np.mean(seconds) * 1e6)
+    path = os.path.join(args.logs, 'bench-ring-n%d-j%d-w%d.json' % (NUM_WORKERS, JOB_ID, rank))
+    with open(path, 'w') as f:
+        json.dump({'num_workers': NUM_WORKERS, 'job_id': JOB_ID, 'rank': rank, 'elems': args.elems,
+                   'iters': args.iters, 'call_us': [t * 1e6 for t in seconds]}, f)
+
+def report(logs):
+    """ Print the pooled latency of all workers per group size """
+    runs, calls = {}, {}
+    for path in glob.glob(os.path.join(logs, 'bench-n*-w*.json')):
+        with open(path) as f:
+            result = json.load(f)
+        runs.setdefault(result['num_workers'], []).extend(result['latency_us'])
+        calls.setdefault(result['num_workers'], []).extend(result.get('call_us', []))
+
+    if runs:
+        print("%8s %8s %10s %10s %10s %10s %14s" % ('workers', 'chunks', 'p50 (us)', 'p90 (us)', 'p99 (us)',
+                                                  'max (us)', 'call p99 (us)'))
+    for num_workers in sorted(runs):
+        stats = percentiles(np.asarray(runs[num_workers]) / 1e6)
+        call_p99 = np.percentile(calls[num_workers], 99) if calls[num_workers] else float('nan')
+        print("%8d %8d %10.0f %10.0f %10.0f %10.0f %14.0f" % (num_workers, len(runs[num_workers]), stats['p50_us'],
+                                                              stats['p90_us'], stats['p99_us'], stats['max_us'],
+                                                              call_p99))
+
+    # Bytes are compared with a dense AllReduce of the same vector, and with
+    # the density of the union, which is what the workers actually send
+    groups = {}
+    for path in glob.glob(os.path.join(logs, 'bench-sparse-*.json')):
+        with open(path) as f:
+            result = json.load(f)
+        group = groups.setdefault((result['num_workers'], result['density']),
+                                  {'packets': [], 'bytes': [], 'union': [], 'call_us': []})
+        group['dense'] = result['dense_bytes']
+        group['packets'].extend(result['packets'])
+        group['bytes'].extend(result['bytes'])
+        group['union'].extend(result['union_density'])
+        group['call_us'].extend(result['call_us'])
+    if groups:
+        if runs:
+            print()
+        print("%8s %8s %8s %10s %10s %10s %10s %10s" % ('workers', 'density', 'union', 'packets', 'bytes',
+                                                        'of dense', 'p50 (us)', 'p99 (us)'))
+    for (num_workers, density), group in sorted(groups.items()):
+        sent = np.mean(group['bytes'])
+        print("%8d %8g %7.1f%% %10.1f %10.0f %9.1f%% %10.0f %10.0f" % (
+            num_workers, density, 100 * np.mean(group['union']), np.mean(group['packets']), sent,
+            100 * sent / group['dense'], np.percentile(group['call_us'], 50), np.percentile(group['call_us'], 99)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-chunk AllReduce latency benchmark")
+    parser.add_argument('rank', type=int, nargs='?', help="rank of this worker")
+    parser.add_argument('--elems', type=int, default=64 * CHUNK_SIZE, help="elements per AllReduce")
+    parser.add_argument('--iters', type=int, default=20, help="measured AllReduce calls")
+    parser.add_argument('--warmup', type=int, default=2, help="AllReduce calls before measuring")
+    parser.add_argument('--window', type=int, default=1,
+                        help="chunks in flight; 1 measures a lone chunk, larger windows add queueing")
+    parser.add_argument('--slow-rank', type=int, default=-1, help="rank of an injected straggler")
+    parser.add_argument('--slow-ms', type=float, default=0, help="how late the straggler starts every call")
+    parser.add_argument('--density', type=float,
+                        help="measure the sparse AllReduce with this fraction of non-zero blocks")
+    parser.add_argument('--transport', choices=('switch', 'ring'), default='switch',
+                        help="measure the in-network AllReduce or the host ring")
+    parser.add_argument('--logs', default=os.environ.get('APP_LOGS', '.'), help="where to write the results")
+    parser.add_argument('--report', metavar='LOGS', help="summarize the results found in LOGS instead")
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.report)
+    elif args.rank is None:
+        parser.error("the rank of the worker is required")
+    elif args.transport == 'ring':
+        run_ring(args)
+    elif args.density is not None:
+        run_sparse(args)
+    else:
+        run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Batched, allocation-free socket I/O for window-sized bursts
+
+    BatchSender transmits a burst of payloads with one sendmsg() per frame,
+    gathering the cached frame headers and the payload straight out of the
+    codec buffer, so payloads are never copied in user space.
+
+    ImpairedSender sends the same frames through a lib.comm.Impairment,
+    which has to copy them since the codec buffer is reused.
+
+    RecvRing drains every pending datagram with recv_into() into a
+    preallocated ring of fixed-size slots.
+"""
+
+import socket
+
+class BatchSender:
+    """
+    Scatter-gather sender of SwitchML payloads over a raw socket
+
+    :param sock: a connected/bound raw (AF_PACKET) socket
+    :param frame: the flow's lib.frame.FrameTemplate
+    """
+
+    def __init__(self, sock, frame):
+        self.sock = sock
+        self.frame = frame
+        self.iov = [None, None]
+
+    def send(self, payload):
+        """ Send one payload, returns the number of bytes sent """
+        iov = self.iov
+        iov[0] = self.frame.headers(len(payload))
+        iov[1] = payload
+        return self.sock.sendmsg(iov)
+
+    def send_batch(self, payloads):
+        """
+        Send a burst of payloads back to back
+        Returns the number of payloads sent before the first error (like
+        sendmmsg) and the error, or None if everything was sent
+        """
+        for i, payload in enumerate(payloads):
+            try:
+                self.send(payload)
+            except OSError as e:
+                return i, e
+        return len(payloads), None
+
+class ImpairedSender(BatchSender):
+    """
+    BatchSender whose frames go through `impairment` (a lib.comm.Impairment)
+    on their way to the socket. Frames are counted as sent when handed over,
+    whether the impaired link loses them or not
+    """
+
+    def __init__(self, sock, frame, impairment):
+        super().__init__(sock, frame)
+        self.impairment = impairment
+
+    def send(self, payload):
+        """ Hand one payload to the impaired link, returns its frame size """
+        packet = b''.join((self.frame.headers(len(payload)), payload))
+        self.impairment.send(self.sock.send, packet)
+        return len(packet)
+
+class RecvRing:
+    """
+    Ring of `slots` preallocated receive buffers of `slot_size` bytes each
+
+    drain() fills the ring from a non-blocking socket, after which packet(i)
+    returns a zero-copy view of the i-th datagram. Views are only valid until
+    the next drain(). A socket error other than running out of datagrams ends
+    a drain early and is kept in `error`, after the datagrams received so far
+    """
+
+    def __init__(self, slots, slot_size):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.buf = bytearray(slots * slot_size)
+        self.views = [memoryview(self.buf)[i * slot_size:(i + 1) * slot_size] for i in range(slots)]
+        self.sizes = [0] * slots
+        self.error = None
+
+    def drain(self, sock):
+        """
+        Receive pending datagrams from non-blocking `sock` until it would block,
+        fails or the ring is full. Returns the number of datagrams received
+        """
+        self.error = None
+        views, sizes = self.views, self.sizes
+        recv_into = sock.recv_into
+        for i in range(self.slots):
+            try:
+                sizes[i] = recv_into(views[i])
+            except (BlockingIOError, socket.timeout):
+                return i
+            except OSError as e:
+                # e.g. ECONNREFUSED from an ICMP error, the caller still
+                # handles what came before it
+                self.error = e
+                return i
+        return self.slots
+
+    def packet(self, i):
+        """ The i-th datagram of the last drain() """
+        return self.views[i][:self.sizes[i]]
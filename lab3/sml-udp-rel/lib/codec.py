@@ -0,0 +1,201 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Whole-vector encoding/decoding of SwitchML payloads
+
+    A SwitchML payload is a 12 byte header (worker_id, chunk_id, num_workers,
+    flags, count, slot, job_id, epoch) followed by `count` 32-bit values,
+    all in network byte order. The header is exactly three 32-bit words, so a
+    payload is at most (3 + CHUNK_SIZE) big-endian words and a whole vector can be laid out as one
+    2D '>u4' array with one row per chunk.
+
+    CHUNK_SIZE is the one place the payload width is configured: network.py
+    compiles p4/main.p4 with -DCHUNK_SIZE=<CHUNK_SIZE> and passes
+    APP_CHUNK_SIZE on to the workers. NUM_SLOTS, the number of the switch's
+    aggregation slots a job uses, is configured the same way; the switch's
+    pool holds NUM_SLOTS slots for every job.
+
+    Chunk number `seq` (counted across all AllReduce calls of a worker) is
+    aggregated in slot seq % NUM_SLOTS. Every slot has two copies, and
+    consecutive uses of a slot alternate between them: the top bit of the
+    16-bit slot field selects the copy, the low 15 bits the slot. The epoch
+    field numbers the uses of a copy, seq // (2 * NUM_SLOTS).
+
+    Partial results (FLAG_PARTIAL) carry a 64-bit bitmap of the workers they
+    contain between the header and the values.
+
+    Before its first chunk a worker joins its job's rendezvous at the switch
+    with a payload without values (see join_payload()).
+"""
+
+import os
+import struct
+import numpy as np
+
+# Values per packet supported by p4/main.p4. 256 values still fit a 1500 byte MTU
+CHUNK_SIZES = (4, 8, 16, 32, 64, 128, 256)
+CHUNK_SIZE = int(os.environ.get('APP_CHUNK_SIZE', 32))
+assert CHUNK_SIZE in CHUNK_SIZES, "APP_CHUNK_SIZE must be one of %s" % (CHUNK_SIZES,)
+
+# Aggregation slots of a job on the switch, which also bounds the chunks in flight.
+# At most half the 8-bit chunk_id space, so in-flight chunk_ids stay unique
+NUM_SLOTS = int(os.environ.get('APP_NUM_SLOTS', 128))
+assert 1 <= NUM_SLOTS <= 128, "APP_NUM_SLOTS must be between 1 and 128"
+
+# Largest aggregation group, the width of the switch's contribution bitmap
+MAX_WORKERS = 64
+
+# worker_id, chunk_id, num_workers, flags, count, slot, job_id, epoch
+HEADER = struct.Struct('!BBBBHHHH')
+HEADER_SIZE = HEADER.size
+HEADER_WORDS = HEADER_SIZE // 4
+VERSION_BIT = 0x8000                # Copy of the slot, in the slot field
+
+# Bits of the flags field, see p4/main.p4
+FLAG_RESULT = 1                     # Aggregated result, set by the switch
+FLAG_SIGNED = 2                     # Values are two's complement
+FLAG_OVERFLOW = 4                   # The switch's sums wrapped around
+FLAG_PARTIAL = 8                    # Released without some workers, see contributors()
+FLAG_JOIN = 16                      # Rendezvous, with FLAG_RESULT the switch's release
+
+CONTRIB = struct.Struct('!Q')       # Bitmap of the workers in a partial result
+
+def p4_compile_flags(num_jobs=1):
+    """
+    Compiler flags that build p4/main.p4 for the configured CHUNK_SIZE, with
+    NUM_SLOTS slots for each of `num_jobs` jobs
+    """
+    return ['-DCHUNK_SIZE=%d' % CHUNK_SIZE, '-DPOOL_SLOTS=%d' % (NUM_SLOTS * num_jobs)]
+
+def slot_field(seq):
+    """ The slot field of chunk number `seq`: its slot index and which copy to use """
+    return (VERSION_BIT if (seq // NUM_SLOTS) & 1 else 0) | (seq % NUM_SLOTS)
+
+def payload_size(count):
+    """ Size in bytes of a SwitchML payload carrying `count` values """
+    return HEADER_SIZE + 4 * count
+
+def join_payload(worker_id, num_workers, job_id, nonce):
+    """ The payload with which a worker joins the rendezvous of its job, `nonce` identifying its run """
+    return HEADER.pack(worker_id & 0xff, 0, num_workers & 0xff, FLAG_JOIN, 0, 0, job_id & 0xffff, nonce & 0xffff)
+
+def unpack_header(data):
+    """
+    Unpack the SwitchML header at the start of `data`
+    Returns: (worker_id, chunk_id, num_workers, flags, count) or None if `data` is too short
+    """
+    if len(data) < HEADER_SIZE:
+        return None
+    return HEADER.unpack_from(data)[:5]
+
+def contributors(data):
+    """ Bitmap of the workers (bit i for rank i) a partial result contains, None for complete ones """
+    if not data[3] & FLAG_PARTIAL or len(data) < HEADER_SIZE + CONTRIB.size:
+        return None
+    return CONTRIB.unpack_from(data, HEADER_SIZE)[0]
+
+class VectorCodec:
+    """
+    Encodes an entire input vector into one preallocated buffer of SwitchML
+    payloads and decodes results straight into one preallocated output array
+
+    Every chunk carries `chunk_size` values except the last one, which only
+    carries what is left of the vector
+
+    :param data: the input vector (list or NumPy array of integers)
+    :param int chunk_size: number of 32-bit values per payload
+    """
+
+    def __init__(self, data, chunk_size=CHUNK_SIZE):
+        self.num_elems = len(data)
+        self.chunk_size = chunk_size
+        self.num_chunks = (self.num_elems + chunk_size - 1) // chunk_size
+        self.row_size = payload_size(chunk_size)
+        self.last_count = self.num_elems - (self.num_chunks - 1) * chunk_size
+
+        # One row per chunk: header words followed by the values, zero padded
+        self.frames = np.zeros((self.num_chunks, HEADER_WORDS + chunk_size), dtype='>u4')
+        data = np.asarray(data, dtype=np.int64)
+        full = self.num_elems // chunk_size
+        self.frames[:full, HEADER_WORDS:] = data[:full * chunk_size].reshape(full, chunk_size)
+        if full < self.num_chunks:
+            self.frames[full, HEADER_WORDS:HEADER_WORDS + self.last_count] = data[full * chunk_size:]
+        self.payloads = memoryview(self.frames.reshape(-1).view(np.uint8))
+
+        self.result = np.zeros(self.num_elems, dtype=np.uint32)
+
+    def count(self, chunk):
+        """ Number of values carried by `chunk` """
+        return self.chunk_size if chunk < self.num_chunks - 1 else self.last_count
+
+    def set_headers(self, worker_id, first_seq, num_workers, flags=0, job_id=0):
+        """
+        Write the header words of every payload. Chunks are numbered consecutively
+        from `first_seq`, which determines their chunk_id (wrapping around 8 bits),
+        their slot (see slot_field()) and epoch
+        """
+        if self.num_chunks == 0:
+            return
+        seqs = first_seq + np.arange(self.num_chunks, dtype=np.int64)
+        slots = np.where((seqs // NUM_SLOTS) & 1, VERSION_BIT, 0) | (seqs % NUM_SLOTS)
+        self.frames[:, 0] = ((worker_id & 0xff) << 24) | ((seqs & 0xff) << 16) | \
+                            ((num_workers & 0xff) << 8) | (flags & 0xff)
+        self.frames[:, 1] = (self.chunk_size << 16) | slots
+        self.frames[-1, 1] = (self.last_count << 16) | slots[-1]
+        self.frames[:, 2] = ((job_id & 0xffff) << 16) | ((seqs // (2 * NUM_SLOTS)) & 0xffff)
+
+    def payload(self, chunk):
+        """ The encoded payload of `chunk`, as a zero-copy memoryview """
+        start = chunk * self.row_size
+        return self.payloads[start:start + payload_size(self.count(chunk))]
+
+    def answers(self, chunk, data):
+        """
+        Whether result payload `data` belongs to `chunk`, i.e. carries its slot
+        and epoch. Results the switch multicasts ahead of a straggler may reuse
+        the chunk_id of one it still waits for
+        """
+        if len(data) < HEADER_SIZE:
+            return False
+        words = np.frombuffer(data, dtype='>u4', count=HEADER_WORDS)
+        return ((words[1] ^ self.frames[chunk, 1]) & 0xffff) == 0 and \
+               ((words[2] ^ self.frames[chunk, 2]) & 0xffff) == 0
+
+    def store(self, chunk, data):
+        """
+        Decode the values of result payload `data` into the slice of `chunk`
+        Returns False if `data` is too short to hold the chunk
+        """
+        count = self.count(chunk)
+        offset = HEADER_SIZE + (CONTRIB.size if data[3] & FLAG_PARTIAL else 0)
+        if len(data) < offset + 4 * count:
+            return False
+        start = chunk * self.chunk_size
+        self.result[start:start + count] = np.frombuffer(data, dtype='>u4', count=count, offset=offset)
+        return True
+
+    def copy_to(self, result):
+        """ Copy the decoded vector into the caller's output list or array """
+        if isinstance(result, np.ndarray):
+            result[:self.num_elems] = self.result
+        else:
+            result[:self.num_elems] = self.result.tolist()
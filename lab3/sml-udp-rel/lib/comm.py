@@ -19,11 +19,26 @@
  CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
  """
 
+"""
+    Socket helpers and network impairments for testing
 
+    Impairment delays, loses, reorders, duplicates and rate-limits outgoing
+    packets without blocking the sender: delayed packets wait in a timed
+    queue that a background thread drains, so only the packet is late, not
+    the worker. Every decision is drawn from a generator seeded with
+    APP_SEED (0 by default) and the rank, which makes the sequence of
+    impairments of every rank reproducible.
+"""
 
+import heapq
+import os
 import socket
 import random
+import threading
 import time
+import sys
+
+SEED = os.environ.get('APP_SEED', '0')
 
 def send(soc, data, addr):
     """ Send `data` to `addr` using socket `soc` """
@@ -33,24 +48,80 @@ def receive(soc, nbytes):
     """ Receive `nbytes` bytes from socket `soc` """
     return soc.recvfrom(nbytes)
 
+class TimedQueue:
+    """
+    Calls scheduled for a point in time, run in order by a daemon thread.
+    Calls due at the same time run in the order they were scheduled
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def __len__(self):
+        with self.cond:
+            return len(self.heap)
+
+    def schedule(self, due, fn, *args):
+        """ Run fn(*args) at time.monotonic() `due` """
+        with self.cond:
+            heapq.heappush(self.heap, (due, self.seq, fn, args))
+            self.seq += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    self.cond.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+                _, _, fn, args = heapq.heappop(self.heap)
+            try:
+                fn(*args)
+            except OSError:
+                pass    # Like a packet lost on the wire
+
+_delayed = TimedQueue()
+_rng = None
+
+def seed(value):
+    """
+    Seed the draws of unreliable_send() and unreliable_receive(). Unless
+    called, they are seeded on first use with APP_SEED and the rank found
+    at sys.argv[1] (see lib.worker.rank())
+    """
+    global _rng
+    _rng = random.Random(value)
+
+def _random():
+    if _rng is None:
+        try:
+            rank = int(sys.argv[1])
+        except (IndexError, ValueError):
+            rank = 0
+        seed('%s:%d' % (SEED, rank))
+    return _rng.random()
+
 def unreliable_send(soc, data, addr, sleep=2, p=0.3):
     """
-    Send 'data' to 'addr' using socket 'soc' with probability 'p' to sleep or drop the packet
+    Send 'data' to 'addr' using socket 'soc' with probability 'p' to delay or drop the packet
     if 'sleep' is a positive integer:
-        the packet has probability 'p' to be delayed by 'sleep' seconds
+        the packet has probability 'p' to be delayed by 'sleep' seconds,
+        while the caller carries on
     if 'sleep' is 0 or negative:
         the packet has probability 'p' to be dropped
     if probability is 0, nothing happens
     """
-    if p and random.random() < p:
+    if p and _random() < p:
         if sleep < 1:
             return
-        time.sleep(sleep)
+        _delayed.schedule(time.monotonic() + sleep, soc.sendto, bytes(data), addr)
+        return
     soc.sendto(data, addr)
-    #
-    # if random.random() < sleep_probability:
-    #     time.sleep(sleep_time)
-    # soc.sendto(data, addr)
 
 def unreliable_receive(soc, nbytes, p=0.3):
     """
@@ -59,6 +130,130 @@ def unreliable_receive(soc, nbytes, p=0.3):
     regardless of the timeout status of the socket, effectively "dropping" the packet
     """
     res = soc.recvfrom(nbytes)
-    if p and random.random() < p:
+    if p and _random() < p:
         raise socket.timeout
-    return res
\ No newline at end of file
+    return res
+
+class GilbertElliott:
+    """
+    Two-state burst loss. The channel moves from the good to the bad state
+    with probability `p` and back with probability `r` before every packet,
+    and loses it with probability `loss_good` or `loss_bad`. The mean burst
+    lasts 1 / r packets
+    """
+
+    def __init__(self, p, r, loss_good=0.0, loss_bad=1.0):
+        self.p = p
+        self.r = r
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+        self.bad = False
+
+    def lose(self, rng):
+        """ Whether the next packet is lost """
+        self.bad = rng.random() >= self.r if self.bad else rng.random() < self.p
+        return rng.random() < (self.loss_bad if self.bad else self.loss_good)
+
+class Impairment:
+    """
+    Impairments applied to the packets a sender hands to send()
+
+    :param seed: seed of the generator behind every decision
+    :param float loss: probability to lose a packet, unless `burst` is given
+    :param GilbertElliott burst: burst loss model instead of independent losses
+    :param float delay: seconds every packet is late
+    :param float jitter: up to this many seconds more, uniformly drawn
+    :param float reorder: probability to hold a packet back by `reorder_delay`
+        seconds more, so that the packets after it overtake it
+    :param float duplicate: probability to send a packet twice
+    :param float rate: bytes per second the link drains, None for unlimited
+    :param float queue: seconds of backlog the rate-limited link buffers
+        before it drops packets
+
+    Packets that are neither late nor behind others are sent right away by
+    the caller, everything else goes through the timed queue
+    """
+
+    def __init__(self, seed=0, loss=0.0, burst=None, delay=0.0, jitter=0.0, reorder=0.0,
+                 reorder_delay=0.001, duplicate=0.0, rate=None, queue=0.05):
+        self.rng = random.Random(seed)
+        self.loss = loss
+        self.burst = burst
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.duplicate = duplicate
+        self.rate = rate
+        self.queue = queue
+        self.link_free = 0.0    # when the rate-limited link has sent its backlog
+        self.last_due = 0.0     # latest departure scheduled, to keep packets in order
+        self.timed = TimedQueue()
+        self.stats = {'sent': 0, 'lost': 0, 'delayed': 0, 'reordered': 0, 'duplicated': 0, 'overflowed': 0}
+
+    @classmethod
+    def from_spec(cls, spec, rank=0):
+        """
+        Build an impairment from a comma separated spec like
+        "loss=0.01,delay_ms=2,jitter_ms=1,reorder=0.01,dup=0.001,rate_mbps=100,seed=7"
+        or with "ge_p=0.01,ge_r=0.25" (and optionally ge_good, ge_bad) for burst
+        loss. Rank `rank` draws from its own generator derived from the seed,
+        which defaults to APP_SEED
+        """
+        opts = dict(item.split('=', 1) for item in spec.split(',') if item)
+        num = lambda key, default=0.0: float(opts.pop(key, default))
+        burst = None
+        if 'ge_p' in opts:
+            burst = GilbertElliott(num('ge_p'), num('ge_r', 1.0), num('ge_good'), num('ge_bad', 1.0))
+        rate = num('rate_mbps')
+        impairment = cls(seed='%s:%d' % (opts.pop('seed', SEED), rank), loss=num('loss'), burst=burst,
+                         delay=num('delay_ms') / 1e3, jitter=num('jitter_ms') / 1e3,
+                         reorder=num('reorder'), reorder_delay=num('reorder_ms', 1.0) / 1e3,
+                         duplicate=num('dup'), rate=rate * 1e6 / 8 if rate else None,
+                         queue=num('queue_ms', 50.0) / 1e3)
+        if opts:
+            raise ValueError("Unknown impairment options: %s" % ', '.join(sorted(opts)))
+        return impairment
+
+    def send(self, transmit, data):
+        """
+        Hand packet `data` (bytes) to the impaired link, which calls
+        transmit(data) when the packet leaves, possibly never or twice.
+        Returns right away
+        """
+        rng = self.rng
+        lost = self.burst.lose(rng) if self.burst is not None else rng.random() < self.loss
+        if lost:
+            self.stats['lost'] += 1
+            return
+
+        now = time.monotonic()
+        due = now
+        if self.rate is not None:
+            start = max(now, self.link_free)
+            if start - now > self.queue:
+                self.stats['overflowed'] += 1
+                return
+            self.link_free = start + len(data) / self.rate
+            due = self.link_free
+        due += self.delay + (rng.random() * self.jitter if self.jitter else 0.0)
+
+        # Packets leave in order unless one is picked to be held back
+        if self.reorder and rng.random() < self.reorder:
+            self.stats['reordered'] += 1
+            self._schedule(due + self.reorder_delay, transmit, data, now)
+        else:
+            due = max(due, self.last_due)
+            self.last_due = due
+            self._schedule(due, transmit, data, now)
+        if self.duplicate and rng.random() < self.duplicate:
+            self.stats['duplicated'] += 1
+            self._schedule(due, transmit, data, now)
+
+    def _schedule(self, due, transmit, data, now):
+        self.stats['sent'] += 1
+        if due <= now and not len(self.timed):
+            transmit(data)
+        else:
+            self.stats['delayed'] += 1
+            self.timed.schedule(due, transmit, data)
@@ -0,0 +1,146 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Precomputed Ethernet/IPv4/UDP frames for raw socket transmission
+
+    A FrameTemplate is built once per flow (source/destination MAC, IP and
+    port). Sending a payload only copies it behind the cached headers, or
+    gathers it next to them with sendmsg(), and patches the IP
+    identification, the length fields and the IP checksum.
+    The checksum is updated incrementally as in RFC 1624, eqn. 3:
+        HC' = ~(~HC + ~m + m')
+"""
+
+import struct
+
+ETH_HEADER_SIZE = 14
+IP_HEADER_SIZE = 20
+UDP_HEADER_SIZE = 8
+HEADERS_SIZE = ETH_HEADER_SIZE + IP_HEADER_SIZE + UDP_HEADER_SIZE
+
+# Offsets of the patched fields within the frame
+_IP_TOTAL_LENGTH = ETH_HEADER_SIZE + 2
+_IP_IDENTIFICATION = ETH_HEADER_SIZE + 4
+_IP_CHECKSUM = ETH_HEADER_SIZE + 10
+_UDP_LENGTH = ETH_HEADER_SIZE + IP_HEADER_SIZE + 4
+
+_U16 = struct.Struct('!H')
+
+def ip_to_int(ip_str):
+    """Convert IP string to 32-bit integer"""
+    parts = ip_str.split('.')
+    return (int(parts[0]) << 24) + (int(parts[1]) << 16) + (int(parts[2]) << 8) + int(parts[3])
+
+def mac_to_bytes(mac_str):
+    """Convert MAC string to 6 bytes"""
+    return bytes.fromhex(mac_str.replace(':', ''))
+
+def calculate_checksum(data):
+    """Calculate IP checksum"""
+    if len(data) % 2 == 1:
+        data += b'\x00'
+
+    checksum = 0
+    for i in range(0, len(data), 2):
+        word = (data[i] << 8) + data[i + 1]
+        checksum += word
+        checksum = (checksum & 0xFFFF) + (checksum >> 16)
+
+    return (~checksum) & 0xFFFF
+
+def update_checksum(checksum, old, new):
+    """
+    Incrementally update an Internet checksum after a 16-bit word of the
+    checksummed data changed from `old` to `new` (RFC 1624)
+    """
+    s = (~checksum & 0xFFFF) + (~old & 0xFFFF) + new
+    s = (s & 0xFFFF) + (s >> 16)
+    s = (s & 0xFFFF) + (s >> 16)
+    return (~s) & 0xFFFF
+
+class FrameTemplate:
+    """
+    Ethernet/IPv4/UDP frame for one flow with a payload slot of up to
+    `max_payload` bytes
+
+    build() returns a view into the template's own buffer, so the frame must be
+    sent before the next call to build()
+    """
+
+    def __init__(self, src_mac, dst_mac, src_ip, dst_ip, src_port, dst_port, max_payload):
+        self.max_payload = max_payload
+        self.buf = bytearray(HEADERS_SIZE + max_payload)
+        self.view = memoryview(self.buf)
+        self.payload_len = max_payload
+        self.ident = 0
+
+        # Ethernet header (14 bytes)
+        struct.pack_into('!6s6sH', self.buf, 0,
+                         mac_to_bytes(dst_mac),    # Destination MAC
+                         mac_to_bytes(src_mac),    # Source MAC
+                         0x0800)                   # EtherType (IPv4)
+
+        # IP header (20 bytes): version 4, header length 5, don't fragment, TTL 64, UDP
+        ip_header = struct.pack('!BBHHHBBHLL',
+                                0x45, 0, IP_HEADER_SIZE + UDP_HEADER_SIZE + max_payload,
+                                self.ident, 0x4000, 64, 17, 0,
+                                ip_to_int(src_ip), ip_to_int(dst_ip))
+        self.checksum = calculate_checksum(ip_header)
+        self.buf[ETH_HEADER_SIZE:ETH_HEADER_SIZE + IP_HEADER_SIZE] = ip_header
+        _U16.pack_into(self.buf, _IP_CHECKSUM, self.checksum)
+
+        # UDP header (8 bytes), checksum is optional for IPv4 and left at 0
+        struct.pack_into('!HHHH', self.buf, ETH_HEADER_SIZE + IP_HEADER_SIZE,
+                         src_port, dst_port, UDP_HEADER_SIZE + max_payload, 0)
+
+    def headers(self, payload_len):
+        """
+        Patch the headers for a payload of `payload_len` bytes and return them,
+        for callers that gather the payload from elsewhere (e.g. sendmsg)
+        """
+        buf = self.buf
+
+        # Fresh IP identification for every frame
+        ident = (self.ident + 1) & 0xFFFF
+        checksum = update_checksum(self.checksum, self.ident, ident)
+        _U16.pack_into(buf, _IP_IDENTIFICATION, ident)
+        self.ident = ident
+
+        # Lengths only change for short (tail) payloads
+        if payload_len != self.payload_len:
+            old_total = IP_HEADER_SIZE + UDP_HEADER_SIZE + self.payload_len
+            new_total = IP_HEADER_SIZE + UDP_HEADER_SIZE + payload_len
+            checksum = update_checksum(checksum, old_total, new_total)
+            _U16.pack_into(buf, _IP_TOTAL_LENGTH, new_total)
+            _U16.pack_into(buf, _UDP_LENGTH, UDP_HEADER_SIZE + payload_len)
+            self.payload_len = payload_len
+
+        _U16.pack_into(buf, _IP_CHECKSUM, checksum)
+        self.checksum = checksum
+        return self.view[:HEADERS_SIZE]
+
+    def build(self, payload):
+        """ Place `payload` behind the headers and return the complete frame """
+        n = len(payload)
+        self.headers(n)
+        self.view[HEADERS_SIZE:HEADERS_SIZE + n] = payload
+        return self.view[:HEADERS_SIZE + n]
@@ -0,0 +1,236 @@
+"""
+ Copyright (c) 2025 Computer Networks Group @ UPB
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of
+ this software and associated documentation files (the "Software"), to deal in
+ the Software without restriction, including without limitation the rights to
+ use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+ the Software, and to permit persons to whom the Software is furnished to do so,
+ subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+ FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ """
+
+"""
+    Concurrent worker launch behind a start barrier
+
+    launch() starts one process per host at once, each pinned to a CPU of
+    its own (round robin over the CPUs this process may use), and releases
+    them together once every one of them reached the barrier, which workers
+    do with barrier() after creating their sockets. No worker sends before
+    all of them can receive, without guessing how long startup takes.
+
+    The barrier is made of named pipes in a directory all hosts see (the
+    log directory): workers announce themselves on `barrier-ready` and wait
+    for the release time on their own `barrier-go-<host>`. A worker that
+    exits or does not show up within the timeout aborts the launch: the
+    others are told to give up, and whoever has not exited ABORT_GRACE
+    seconds later is terminated, then killed.
+
+    launch() returns a report with the launch, ready, release and exit time
+    (seconds since the epoch) and exit status of every host, and writes it
+    to launch.json in the barrier directory.
+"""
+
+import asyncio
+import json
+import os
+import select
+import subprocess
+import threading
+import time
+
+BARRIER_TIMEOUT = 60.0    # Seconds to wait for all workers to reach the barrier
+ABORT_GRACE = 5.0         # Seconds an aborted worker gets to exit on its own, and then to die
+READY_FIFO = 'barrier-ready'
+REPORT_FILE = 'launch.json'
+
+_released = None          # Release time of this process' barrier, once passed
+
+def _go_fifo(directory, host):
+    return os.path.join(directory, 'barrier-go-%d' % host)
+
+def _mkfifo(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    os.mkfifo(path)
+
+def wait_barrier(host, timeout=BARRIER_TIMEOUT):
+    """
+    Announce host `host` at the barrier of the launcher that started this
+    process and block until it releases all hosts. Returns the release
+    time, or None if this process was not started by launch(). Raises
+    TimeoutError if the launch was aborted or took longer than `timeout`
+    """
+    global _released
+    directory = os.environ.get('APP_BARRIER')
+    if not directory or _released is not None:
+        return _released
+
+    # Hold the read end open before announcing, so the release cannot be missed
+    go = os.open(_go_fifo(directory, host), os.O_RDWR)
+    try:
+        ready = os.open(os.path.join(directory, READY_FIFO), os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            os.write(ready, b'%d %d %f\n' % (host, os.getpid(), time.time()))
+        finally:
+            os.close(ready)
+        if not select.select([go], [], [], timeout)[0]:
+            raise TimeoutError("Not released from the start barrier within %gs" % timeout)
+        message = os.read(go, 64).split()
+    finally:
+        os.close(go)
+    if not message or message[0] == b'abort':
+        raise TimeoutError("Launch aborted at the start barrier")
+    _released = float(message[0])
+    return _released
+
+async def barrier(host, timeout=BARRIER_TIMEOUT):
+    """
+    wait_barrier() without blocking the event loop. Returns True once
+    released, and False if this process was not started by launch()
+    """
+    if _released is None and os.environ.get('APP_BARRIER'):
+        await asyncio.get_running_loop().run_in_executor(None, wait_barrier, host, timeout)
+    return _released is not None
+
+def _cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+def _pinned(cpu):
+    # Pins the child before exec, so that every thread it starts stays on `cpu`
+    return lambda: os.sched_setaffinity(0, {cpu})
+
+def _stop(procs, grace):
+    """ Terminate the processes still running, and kill those that outlive `grace` seconds """
+    for proc in procs:
+        if proc.poll() is None:
+            proc.terminate()
+    deadline = time.time() + grace
+    for proc in procs:
+        try:
+            proc.wait(max(0.0, deadline - time.time()))
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def _join(threads, deadline):
+    """ Join `threads` until `deadline` (None for no limit), returns whether all of them ended """
+    for thread in threads:
+        thread.join(None if deadline is None else max(0.0, deadline - time.time()))
+    return not any(thread.is_alive() for thread in threads)
+
+def launch(start, hosts, directory, timeout=BARRIER_TIMEOUT, pin=True, run_timeout=None):
+    """
+    Start `hosts` processes behind a common start barrier and wait for all
+    of them to exit
+
+    :param start: start(host, env, preexec_fn) starts the process of `host`
+        with the variables `env` added to its environment and `preexec_fn`
+        run in the child before exec, and returns its subprocess.Popen
+    :param int hosts: number of processes, numbered 0..hosts-1
+    :param str directory: where to create the barrier and the report
+    :param float timeout: seconds allowed until all processes reach the barrier
+    :param bool pin: pin every process to a CPU of its own, round robin
+    :param float run_timeout: seconds the processes may run once released,
+        None for no limit. Processes still running then are stopped
+
+    Returns the report, a list with a dict per host, see REPORT_FILE
+    """
+    os.makedirs(directory, exist_ok=True)
+    ready_path = os.path.join(directory, READY_FIFO)
+    _mkfifo(ready_path)
+    for host in range(hosts):
+        _mkfifo(_go_fifo(directory, host))
+    # Opened for reading and writing, so the pipe never reports EOF in between
+    # workers, and so that the release waits in the pipe of a worker that
+    # has not opened it yet
+    ready_fd = os.open(ready_path, os.O_RDWR | os.O_NONBLOCK)
+    go_fds = [os.open(_go_fifo(directory, host), os.O_RDWR | os.O_NONBLOCK) for host in range(hosts)]
+
+    cpus = _cpus()
+    report = [dict(host=host, pid=None, cpu=cpus[host % len(cpus)] if pin else None, launched=None,
+                   ready=None, released=None, exited=None, status=None) for host in range(hosts)]
+    exited = threading.Event()
+
+    def wait(proc, entry):
+        entry['status'] = proc.wait()
+        entry['exited'] = time.time()
+        exited.set()
+
+    waiters, procs = [], []
+    try:
+        for entry in report:
+            env = {'APP_BARRIER': directory}
+            entry['launched'] = time.time()
+            proc = start(entry['host'], env, _pinned(entry['cpu']) if pin else None)
+            entry['pid'] = proc.pid
+            procs.append(proc)
+            waiters.append(threading.Thread(target=wait, args=(proc, entry), daemon=True))
+            waiters[-1].start()
+
+        # Gather the workers at the barrier, until one of them gives up
+        deadline = time.time() + timeout
+        pending, buf = hosts, b''
+        while pending and not exited.is_set() and time.time() < deadline:
+            if not select.select([ready_fd], [], [], 0.1)[0]:
+                continue
+            buf += os.read(ready_fd, 4096)
+            *lines, buf = buf.split(b'\n')
+            for line in lines:
+                host, pid, t = line.split()
+                report[int(host)]['ready'] = float(t)
+                pending -= 1
+
+        # Release everyone at once, or send them home, including those still
+        # on their way to the barrier
+        release = time.time()
+        message = b'%f\n' % release if not pending else b'abort\n'
+        for entry, fd in zip(report, go_fds):
+            os.write(fd, message)
+            if not pending:
+                entry['released'] = release
+
+        # Workers that never got to the barrier may be stuck for good, and
+        # those that did get ABORT_GRACE seconds to leave on their own
+        if pending:
+            deadline = time.time() + ABORT_GRACE
+        else:
+            deadline = release + run_timeout if run_timeout is not None else None
+        if not _join(waiters, deadline):
+            _stop(procs, ABORT_GRACE)
+            _join(waiters, time.time() + ABORT_GRACE)
+    except BaseException:
+        _stop(procs, 0)
+        raise
+    finally:
+        for fd in [ready_fd] + go_fds:
+            os.close(fd)
+        for path in [ready_path] + [_go_fifo(directory, host) for host in range(hosts)]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    with open(os.path.join(directory, REPORT_FILE), 'w') as f:
+        json.dump(report, f, indent=1)
+    return report
+
+def summary(report):
+    """ A table of the report, with times in milliseconds after the first launch """
+    t0 = min(entry['launched'] for entry in report)
+    ms = lambda t: '%9.1f' % ((t - t0) * 1e3) if t is not None else '        -'
+    lines = ["host  cpu      pid  launched     ready  released    exited  status"]
+    for e in report:
+        lines.append("%4d %4s %8s %s %s %s %s %7s" % (e['host'], e['cpu'] if e['cpu'] is not None else '-',
+                                                     e['pid'], ms(e['launched']), ms(e['ready']),
+                                                     ms(e['released']), ms(e['exited']), e['status']))
+    return '\n'.join(lines)
@@ -0,0 +1,141 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""
+    Block-scaled fixed-point quantization of floating point vectors
+
+    The switch only adds 32-bit integers, so a float vector is reduced in two
+    passes. Each pass is an ordinary integer AllReduce:
+
+    1. Every worker splits the vector into blocks of QUANT_BLOCK values. For
+       each block it contributes 2^(e - exp_min), where e is the exponent of
+       the block's largest magnitude (|x| < 2^e). The switch sums these one-hot
+       words, so the summed word S of a block bounds the sum of all magnitudes
+       the workers will add: sum |x| < S * 2^exp_min.
+
+    2. Every worker scales its block by the same power of two, chosen from S
+       so that the sum fits in 31 bits, and sends the rounded values as two's
+       complement integers. The switch's wrap-around addition is exact.
+
+    The result is rescaled by the same factor. Each worker's rounding adds at
+    most half a unit to every sum, see BlockQuantizer.error_bound(). Magnitudes
+    of 2^exp_max and above saturate.
+
+    The exponent pass can be skipped with a fixed scale, fixed_shift(). The
+    optimistic one leaves no headroom for adding the workers' values, so
+    the switch may flag chunks as overflowed; those are sent again at the
+    safe fixed scale, which never overflows but keeps fewer bits of small
+    values.
+"""
+
+import numpy as np
+
+# Values sharing one exponent. The exponent pass sends one word per block
+QUANT_BLOCK = 256
+
+# Largest representable magnitude is just below 2^EXP_MAX
+EXP_MAX = 8
+
+# Bits of a 32-bit word the scaled sums may use, keeping one bit spare for
+# the rounding of every worker
+_SUM_BITS = 30
+
+class BlockQuantizer:
+    """
+    Conversion between float vectors and the integer vectors of both passes
+
+    :param int num_workers: number of workers whose contributions are summed
+    :param int block_size: values sharing an exponent
+    :param int exp_max: magnitudes saturate just below 2^exp_max
+    """
+
+    def __init__(self, num_workers, block_size=QUANT_BLOCK, exp_max=EXP_MAX):
+        self.num_workers = num_workers
+        self.block_size = block_size
+        # num_workers one-hot words of up to 2^span must not overflow 32 bits
+        self.span = 32 - num_workers.bit_length()
+        self.exp_max = exp_max
+        self.exp_min = exp_max - self.span
+        self.limit = np.nextafter(np.ldexp(1.0, exp_max), 0)
+
+    def num_blocks(self, n):
+        """ Number of blocks of a vector of `n` values """
+        return (n + self.block_size - 1) // self.block_size
+
+    def _blocks(self, data):
+        # View `data` as one row per block, zero padding the last one
+        x = np.clip(np.asarray(data, dtype=np.float64), -self.limit, self.limit)
+        pad = self.num_blocks(len(x)) * self.block_size - len(x)
+        return np.pad(x, (0, pad)).reshape(-1, self.block_size)
+
+    def _per_block(self, shift, n):
+        return np.broadcast_to(np.asarray(shift), (self.num_blocks(n),))[:, None]
+
+    def shifts(self, bounds):
+        """
+        Scale of every block as a power of two, from the summed `bounds` of
+        the exponent pass: the summed magnitudes stay below 2^_SUM_BITS
+        """
+        # frexp(S) has S < 2^exp, so sum |x| < 2^(exp + exp_min)
+        exp = np.frexp(np.asarray(bounds, dtype=np.float64))[1]
+        return _SUM_BITS - exp - self.exp_min
+
+    def fixed_shift(self, safe=False):
+        """
+        Scale of all blocks without an exponent pass. Only the `safe` one
+        leaves room for the sum of all workers' largest values
+        """
+        shift = _SUM_BITS - self.exp_max
+        return shift - self.num_workers.bit_length() if safe else shift
+
+    def bounds(self, data):
+        """ The words this worker contributes to the exponent pass """
+        peak = np.abs(self._blocks(data)).max(axis=1) if len(data) else np.zeros(0)
+        exp = np.clip(np.frexp(peak)[1] - self.exp_min, 0, self.span)
+        return np.where(peak > 0, np.left_shift(1, exp, dtype=np.int64), 0).astype(np.uint32)
+
+    def encode(self, data, shift):
+        """ The integers this worker contributes, scaled by 2^shift (per block or for all) """
+        n = len(data)
+        if n == 0:
+            return np.zeros(0, dtype=np.uint32)
+        scaled = np.ldexp(self._blocks(data), self._per_block(shift, n))
+        return np.rint(scaled).astype(np.int64).reshape(-1)[:n].astype(np.uint32)
+
+    def decode(self, sums, shift):
+        """ The float sums from the aggregated integers `sums`, scaled by 2^shift """
+        n = len(sums)
+        if n == 0:
+            return np.zeros(0)
+        pad = self.num_blocks(n) * self.block_size - n
+        q = np.pad(np.asarray(sums, dtype=np.uint32).view(np.int32), (0, pad))
+        x = np.ldexp(q.reshape(-1, self.block_size).astype(np.float64), -self._per_block(shift, n))
+        return x.reshape(-1)[:n]
+
+    def error_bound(self, shift):
+        """ Largest absolute error of sums scaled by 2^shift, from rounding """
+        return np.ldexp(self.num_workers / 2, -np.asarray(shift))
+
+    def value_bounds(self, shift, n):
+        """ error_bound() of each of `n` values scaled by 2^shift (per block or for all) """
+        bound = np.broadcast_to(self.error_bound(self._per_block(shift, n)), (self.num_blocks(n), self.block_size))
+        return bound.reshape(-1)[:n].copy()
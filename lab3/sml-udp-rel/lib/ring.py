@@ -0,0 +1,160 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""
+    Host-based ring AllReduce, the software baseline for (and fallback from)
+    the in-network AllReduce
+
+    The vector is cut into one segment per worker. In n - 1 reduce-scatter
+    steps every worker sends a segment to its successor and adds the one it
+    receives from its predecessor, after which worker r holds the complete
+    sums of segment r + 1. In n - 1 all-gather steps the complete segments
+    travel once around the ring. Every worker sends and receives 2 (n - 1) / n
+    of the vector, over one TCP connection to each neighbour.
+
+    Sums wrap around 32 bits like the switch's, and a wrap is reported rather
+    than corrected. Every message is a flag byte (1 if a sum in the segment
+    wrapped) followed by the segment's 32-bit values in host byte order.
+"""
+
+import asyncio
+import numpy as np
+
+CONNECT_TIMEOUT = 10.0    # Seconds to wait for both neighbours
+CONNECT_RETRY = 0.05      # Seconds between attempts to reach the successor
+
+def _add(a, b, signed):
+    # Sum of two uint32 segments and whether any value wrapped around
+    t = a + b
+    if signed:
+        wrapped = ((a ^ t) & (b ^ t)) >> 31
+    else:
+        wrapped = t < a
+    return t, bool(wrapped.any())
+
+class Ring:
+    """
+    The connections of one worker to its neighbours in a ring of workers,
+    see Ring.open()
+    """
+
+    def __init__(self, rank, size, server=None, reader=None, writer=None, peer=None):
+        self.rank = rank
+        self.size = size
+        self.server = server
+        self.reader = reader    # from the predecessor
+        self.writer = writer    # to the successor
+        self.peer = peer        # the predecessor's end, for closing it
+        self.bytes_sent = 0
+
+    @classmethod
+    async def open(cls, rank, addrs, timeout=CONNECT_TIMEOUT):
+        """
+        Join the ring of workers listening on `addrs`, a list of (host, port)
+        in rank order: listen on addrs[rank], connect to the successor and
+        accept the predecessor. Raises OSError or asyncio.TimeoutError if
+        either does not show up within `timeout` seconds
+        """
+        size = len(addrs)
+        if size == 1:
+            return cls(rank, size)
+
+        loop = asyncio.get_running_loop()
+        accepted = loop.create_future()
+
+        def on_accept(reader, writer):
+            if accepted.done():
+                writer.close()
+            else:
+                accepted.set_result((reader, writer))
+
+        async def connect():
+            # The successor may not be listening yet
+            host, port = addrs[(rank + 1) % size]
+            while True:
+                try:
+                    return await asyncio.open_connection(host, port)
+                except ConnectionRefusedError:
+                    await asyncio.sleep(CONNECT_RETRY)
+
+        server = await asyncio.start_server(on_accept, *addrs[rank], reuse_address=True)
+        connecting = asyncio.ensure_future(connect())
+        try:
+            (_, writer), (reader, peer) = await asyncio.wait_for(
+                asyncio.gather(connecting, accepted), timeout)
+        except BaseException:
+            server.close()
+            connecting.cancel()
+            if connecting.done() and not connecting.cancelled() and connecting.exception() is None:
+                connecting.result()[1].close()
+            if accepted.done() and not accepted.cancelled():
+                accepted.result()[1].close()
+            raise
+        return cls(rank, size, server, reader, writer, peer)
+
+    def close(self):
+        """ Close the connections and stop listening """
+        for writer in (self.writer, self.peer):
+            if writer is not None:
+                writer.close()
+        if self.server is not None:
+            self.server.close()
+
+    async def _shift(self, segment, wrapped, count):
+        # Send `segment` to the successor while receiving `count` values from
+        # the predecessor. Both sides must run at once: a worker that waits
+        # for its send to drain before reading blocks the whole ring
+        self.writer.write(bytes([wrapped]))
+        self.writer.write(segment.tobytes())
+        self.bytes_sent += 1 + segment.nbytes
+        message, _ = await asyncio.gather(self.reader.readexactly(1 + 4 * count), self.writer.drain())
+        return np.frombuffer(message, dtype=np.uint32, offset=1), bool(message[0])
+
+    async def allreduce(self, data, signed=False):
+        """
+        Sum `data` (integers, taken modulo 2^32) over the ring. Returns the
+        sums as a uint32 array and whether any of them wrapped around, as
+        two's complement values if `signed`. Raises asyncio.IncompleteReadError
+        or OSError if a neighbour goes away
+        """
+        values = np.asarray(data, dtype=np.int64).astype(np.uint32)
+        if self.size == 1:
+            return values, False
+
+        n, rank = self.size, self.rank
+        bounds = np.linspace(0, len(values), n + 1).astype(int)
+        segments = [values[bounds[i]:bounds[i + 1]].copy() for i in range(n)]
+        wrapped = [False] * n
+
+        # Reduce-scatter: in step s, send segment rank - s and add into rank - s - 1
+        for s in range(n - 1):
+            send, recv = (rank - s) % n, (rank - s - 1) % n
+            incoming, incoming_wrapped = await self._shift(segments[send], wrapped[send], len(segments[recv]))
+            segments[recv], step_wrapped = _add(segments[recv], incoming, signed)
+            wrapped[recv] = incoming_wrapped or step_wrapped
+
+        # All-gather: segment rank + 1 is complete, pass the complete ones on
+        for s in range(n - 1):
+            send, recv = (rank + 1 - s) % n, (rank - s) % n
+            segments[recv], wrapped[recv] = await self._shift(segments[send], wrapped[send], len(segments[recv]))
+
+        return np.concatenate(segments), any(wrapped)
@@ -152,7 +152,7 @@ def RunIntTest(testid, rank, data, num_fails=4, std_out=False):
         return int(a) == int(b)
     return _run_test(testid, rank, data, _test_int, int, not std_out, num_fails)
 
-def RunFloatTest(testid, rank, data, tol=1e-04, num_fails=4, std_out=False):
+def RunFloatTest(testid, rank, data, tol=1e-04, num_fails=4, std_out=False, abs_tol=0.0):
     """
     Run the test specififed by <testid>, on a worker with rank <rank>
 
@@ -164,6 +164,9 @@ def RunFloatTest(testid, rank, data, tol=1e-04, num_fails=4, std_out=False):
     This test will perform floating point comparisson on the values,
     which is done with a tolerance controlled by 'tol'
     The default value checks if values are equal up to 4 decimal places
+    Values within 'abs_tol' of the expected one pass as well, e.g. for the
+    error bound of a quantized AllReduce,
+    where small values next to much larger ones lose relative precision
 
     By default, the outcome is written in the file:
         TEST_ROOT/test-<testid>/result-rank-<rank>.txt
@@ -171,7 +174,7 @@ def RunFloatTest(testid, rank, data, tol=1e-04, num_fails=4, std_out=False):
 
     If the test fails, up to num_fails failures will be shown
     """
-    def _test_float(a, b, rel_tol=rel_t, abs_tol=0.0):
+    def _test_float(a, b, rel_tol=tol, abs_tol=abs_tol):
         # https://peps.python.org/pep-0485/#proposed-implementation
         return abs(a-b) <= max(rel_tol * max(abs(a), abs(b)), abs_tol)
     return _run_test(testid, rank, data, _test_float, float, not std_out, num_fails)
\ No newline at end of file
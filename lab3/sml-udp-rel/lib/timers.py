@@ -0,0 +1,114 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Retransmission deadlines for outstanding chunks
+
+    A binary heap of (deadline, key) entries with lazy cancellation: the
+    current deadline of every key lives in a dict, and heap entries that no
+    longer match it are skipped when they surface. Scheduling costs
+    O(log n), cancelling is O(1), and the earliest deadline is available
+    in O(1) amortized for use as a select() timeout.
+
+    How long to wait comes from RttEstimator, which adapts the timeout to
+    the measured round-trip time of the switch.
+"""
+
+import heapq
+
+class TimerHeap:
+    """
+    Deadlines keyed by an arbitrary hashable key (e.g. a chunk number).
+    Re-scheduling a key replaces its previous deadline
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, key, deadline):
+        """ Arm (or re-arm) the timer of `key` to fire at `deadline` """
+        self.deadlines[key] = deadline
+        heapq.heappush(self.heap, (deadline, key))
+
+    def cancel(self, key):
+        """ Disarm the timer of `key`, if any """
+        self.deadlines.pop(key, None)
+
+    def _discard_stale(self):
+        heap, deadlines = self.heap, self.deadlines
+        while heap and deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def next_deadline(self):
+        """ The earliest armed deadline, or None if no timer is armed """
+        self._discard_stale()
+        return self.heap[0][0] if self.heap else None
+
+    def expired(self, now):
+        """ Disarm and return the keys of all timers due at `now`, earliest first """
+        keys = []
+        heap, deadlines = self.heap, self.deadlines
+        while True:
+            self._discard_stale()
+            if not heap or heap[0][0] > now:
+                return keys
+            deadline, key = heapq.heappop(heap)
+            del deadlines[key]
+            keys.append(key)
+
+class RttEstimator:
+    """
+    Retransmission timeout from smoothed round-trip times (RFC 6298)
+
+    Keeps the Jacobson/Karels estimates SRTT and RTTVAR and derives
+    RTO = SRTT + 4 * RTTVAR, clamped to [min_rto, max_rto]. Only feed it
+    samples of chunks that were sent once (Karn's rule): the result of a
+    retransmitted chunk may answer any of its copies
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_rto, min_rto, max_rto):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = min(max(initial_rto, min_rto), max_rto)
+
+    def sample(self, rtt):
+        """ Update the estimate with a round-trip time measured in seconds """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += self.BETA * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self.ALPHA * (rtt - self.srtt)
+        self.rto = min(max(self.srtt + self.K * self.rttvar, self.min_rto), self.max_rto)
+
+    def timeout(self, attempt):
+        """ Timeout for the `attempt`-th transmission of a chunk, doubled on every retry """
+        return min(self.rto * (1 << min(attempt - 1, 30)), self.max_rto)
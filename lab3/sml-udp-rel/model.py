@@ -0,0 +1,466 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""
+    Behavioral model of the switch (p4/main.p4) for switchless runs
+
+    Serves MyIngress and MyEgress of a single switch on a local UDP port,
+    without BMv2, Mininet or root:
+
+        python model.py &
+        APP_SWITCH_MODEL=127.0.0.1:9999 python worker.py 0 &
+        APP_SWITCH_MODEL=127.0.0.1:9999 python worker.py 1 & ...
+
+    or let the model start one process per rank of every job and wait for
+    them, e.g. for the benchmark:
+
+        python model.py --run bench.py --elems 65536
+
+    Workers send the same Ethernet/IPv4/UDP frames they put on eth0 as UDP
+    datagrams to the model, and receive results on their usual UDP port. The
+    ingress port of a frame is that of the host its source IP belongs to.
+    The model configures itself like network.py does from APP_NUM_WORKERS,
+    APP_NUM_JOBS, APP_QUORUM and APP_DEADLINE_US; leaf switches are not
+    modelled.
+
+    --loss drops that fraction of the frames to and from the model, drawn
+    from a generator seeded with --seed.
+
+    The registers mirror those of MyIngress. At startup their widths and
+    sizes, MAX_WORKERS and the FLAG_* bits are checked against the P4 source,
+    so the model refuses to run once the two have drifted apart.
+"""
+
+from lib import config # do not import anything before this
+from lib.codec import CHUNK_SIZE, NUM_SLOTS, MAX_WORKERS, HEADER, HEADER_SIZE, CONTRIB
+from lib.codec import FLAG_RESULT, FLAG_SIGNED, FLAG_OVERFLOW, FLAG_PARTIAL, FLAG_JOIN
+from lib.frame import ETH_HEADER_SIZE, UDP_HEADER_SIZE
+from lib.launch import launch, summary
+from collections import namedtuple
+import numpy as np
+import subprocess
+import random
+import threading
+import argparse
+import socket
+import struct
+import time
+import sys
+import os
+import re
+
+NUM_WORKERS = int(os.environ.get('APP_NUM_WORKERS', 3))
+NUM_JOBS = int(os.environ.get('APP_NUM_JOBS', 1))
+NUM_HOSTS = NUM_JOBS * NUM_WORKERS
+QUORUM = int(os.environ.get('APP_QUORUM', 0)) or NUM_WORKERS
+DEADLINE_US = int(os.environ.get('APP_DEADLINE_US', 0))
+assert 1 <= NUM_WORKERS <= MAX_WORKERS, "APP_NUM_WORKERS must be between 1 and %d" % MAX_WORKERS
+assert 1 <= QUORUM <= NUM_WORKERS, "APP_QUORUM must be between 1 and APP_NUM_WORKERS"
+assert not int(os.environ.get('APP_NUM_LEAVES', 0)), "The model is a single switch"
+
+SWITCHML_PORT = 9999
+MAX_JOBS = 16               # Must match MAX_JOBS in p4/main.p4
+JOIN_TIMEOUT = 10000000     # Must match JOIN_TIMEOUT in p4/main.p4, in microseconds
+P4_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'p4', 'main.p4')
+
+# Registers of MyIngress: name -> (bit width, entries)
+POOL = 2 * NUM_SLOTS * NUM_JOBS
+REGISTERS = {
+    'agg_value':     (32, POOL * CHUNK_SIZE),
+    'worker_bitmap': (MAX_WORKERS, POOL),
+    'worker_count':  (8, POOL),
+    'result_ready':  (1, POOL),
+    'agg_overflow':  (1, POOL),
+    'agg_epoch':     (16, POOL),
+    'first_seen':    (48, POOL),
+    'agg_partial':   (MAX_WORKERS, POOL),
+    'join_bitmap':   (MAX_WORKERS, MAX_JOBS),
+    'join_count':    (8, MAX_JOBS),
+    'join_started':  (48, MAX_JOBS),
+    'join_released': (1, MAX_JOBS),
+    'join_nonce':    (16, MAX_JOBS * MAX_WORKERS),
+    'job_session':   (16, MAX_JOBS),
+    'agg_session':   (16, POOL),
+}
+
+# Entries of job_config
+Job = namedtuple('Job', 'num_workers slot_base num_slots mgid quorum deadline')
+
+def check_p4(path=P4_SOURCE):
+    """
+    Compare the model with the P4 program at `path`: its registers, the
+    contribution bitmap width and the header flags. Returns a list of
+    mismatches, empty if there are none
+    """
+    with open(path) as f:
+        source = f.read()
+    defines = dict(re.findall(r'^#define\s+(\w+)\s+(\d+)\s*$', source, re.M))
+    errors = []
+
+    for name, value in (('MAX_WORKERS', MAX_WORKERS), ('MAX_JOBS', MAX_JOBS), ('JOIN_TIMEOUT', JOIN_TIMEOUT),
+                        ('FLAG_RESULT', FLAG_RESULT), ('FLAG_SIGNED', FLAG_SIGNED),
+                        ('FLAG_OVERFLOW', FLAG_OVERFLOW), ('FLAG_PARTIAL', FLAG_PARTIAL),
+                        ('FLAG_JOIN', FLAG_JOIN)):
+        if int(defines.get(name, -1)) != value:
+            errors.append("%s is %s in the P4 program, %d here" % (name, defines.get(name), value))
+
+    # Sizes are evaluated for the pool and chunk size the model runs with
+    sizes = {'POOL_SLOTS': NUM_SLOTS * NUM_JOBS, 'CHUNK_SIZE': CHUNK_SIZE, 'MAX_JOBS': MAX_JOBS,
+             'MAX_WORKERS': MAX_WORKERS}
+    declared = {}
+    for width, size, name in re.findall(r'register<(.+?)>\s*\(([^)]*)\)\s*(\w+)\s*;', source):
+        width = MAX_WORKERS if width == 'bitmap_t' else int(re.fullmatch(r'bit<(\d+)>', width).group(1))
+        declared[name] = (width, eval(re.sub(r'[A-Z_]+', lambda m: str(sizes[m.group(0)]), size)))
+    for name in sorted(set(declared) | set(REGISTERS)):
+        if declared.get(name) != REGISTERS.get(name):
+            errors.append("Register %s is %s in the P4 program, %s here" % (name, declared.get(name), REGISTERS.get(name)))
+    return errors
+
+class Packet:
+    """ The SwitchML header, contribution bitmap and values of a frame """
+
+    def __init__(self, payload):
+        (self.worker_id, self.chunk_id, self.num_workers, self.flags, self.count,
+         slot, self.job_id, self.epoch) = HEADER.unpack_from(payload)
+        self.version, self.slot = slot >> 15, slot & 0x7fff
+        offset = HEADER_SIZE
+        self.contrib = None
+        if self.flags & FLAG_PARTIAL:
+            self.contrib = CONTRIB.unpack_from(payload, offset)[0]
+            offset += CONTRIB.size
+        self.values = np.frombuffer(payload, dtype='>u4', count=self.count, offset=offset).astype(np.uint32)
+
+    def add_contrib(self, bitmap):
+        self.flags |= FLAG_PARTIAL
+        self.contrib = bitmap
+
+    def pack(self):
+        header = HEADER.pack(self.worker_id, self.chunk_id, self.num_workers, self.flags, self.count,
+                             (self.version << 15) | self.slot, self.job_id, self.epoch)
+        contrib = CONTRIB.pack(self.contrib) if self.contrib is not None else b''
+        return header + contrib + self.values.astype('>u4').tobytes()
+
+def parse(frame):
+    """
+    MyParser: the SwitchML packet in Ethernet frame `frame`, or None for
+    anything the switch would not aggregate (including parser errors)
+    """
+    if len(frame) < ETH_HEADER_SIZE + 20 or struct.unpack_from('!H', frame, 12)[0] != 0x0800:
+        return None
+    ihl = (frame[ETH_HEADER_SIZE] & 0xf) * 4
+    udp = ETH_HEADER_SIZE + ihl
+    if frame[ETH_HEADER_SIZE + 9] != 17 or len(frame) < udp + UDP_HEADER_SIZE + HEADER_SIZE:
+        return None
+    if struct.unpack_from('!H', frame, udp + 2)[0] != SWITCHML_PORT:
+        return None
+    payload = frame[udp + UDP_HEADER_SIZE:]
+    flags, count = payload[3], struct.unpack_from('!H', payload, 4)[0]
+    needed = HEADER_SIZE + (CONTRIB.size if flags & FLAG_PARTIAL else 0) + 4 * count
+    if count > CHUNK_SIZE or len(payload) < needed:
+        return None
+    return Packet(payload)
+
+class SwitchModel:
+    """
+    Registers and tables of one switch, and MyIngress/MyEgress over them.
+    Scalar registers are lists, agg_value holds CHUNK_SIZE sums per row
+    """
+
+    def __init__(self):
+        self.agg_value = np.zeros((POOL, CHUNK_SIZE), dtype=np.uint32)
+        self.worker_bitmap = [0] * POOL
+        self.worker_count = [0] * POOL
+        self.result_ready = [0] * POOL
+        self.agg_overflow = [0] * POOL
+        self.agg_epoch = [0] * POOL
+        self.first_seen = [0] * POOL
+        self.agg_partial = [0] * POOL
+        self.join_bitmap = [0] * MAX_JOBS
+        self.join_count = [0] * MAX_JOBS
+        self.join_started = [0] * MAX_JOBS
+        self.join_released = [0] * MAX_JOBS
+        self.join_nonce = [0] * (MAX_JOBS * MAX_WORKERS)
+        self.job_session = [0] * MAX_JOBS
+        self.agg_session = [0] * POOL
+
+        self.job_config = {}        # job_id -> Job
+        self.worker_config = {}     # (job_id, worker_id) -> member
+        self.mcast_groups = {}      # mgid -> [port]
+        self.result_dst = {}        # egress port -> (ip, udp port)
+
+    def configure(self):
+        """ The control plane of network.py for a single switch: host h is on port h + 1 """
+        for job in range(NUM_JOBS):
+            first = job * NUM_WORKERS
+            self.mcast_groups[job + 1] = [h + 1 for h in range(first, first + NUM_WORKERS)]
+            self.job_config[job] = Job(NUM_WORKERS, job * NUM_SLOTS, NUM_SLOTS, job + 1, QUORUM, DEADLINE_US)
+            for rank in range(NUM_WORKERS):
+                self.worker_config[(job, rank)] = rank
+        for h in range(NUM_HOSTS):
+            self.result_dst[h + 1] = ('127.0.0.1', 10000 + h)
+
+    def ingress(self, pkt, port, now):
+        """
+        MyIngress for SwitchML packet `pkt` arriving on `port` at `now`
+        microseconds. Returns the packets it sends as (egress port, packet)
+        """
+        job = self.job_config.get(pkt.job_id)
+        if job is None or pkt.slot >= job.num_slots:
+            return []
+
+        reg_index = ((job.slot_base + pkt.slot) << 1) | pkt.version
+        shadow_index = reg_index ^ 1
+        signed = pkt.flags & FLAG_SIGNED
+        received = self.worker_count[reg_index]
+        ready = self.result_ready[reg_index]
+        wrapped = self.agg_overflow[reg_index]
+        epoch = self.agg_epoch[reg_index]
+        partial = self.agg_partial[reg_index]
+
+        session = self.job_session[pkt.job_id]
+        stale = self.agg_session[reg_index] != session
+        if stale:
+            received, ready, wrapped, epoch, partial = 0, 0, 0, pkt.epoch, 0
+
+        # Results only arrive on the uplink of a leaf
+        if pkt.flags & FLAG_RESULT:
+            return []
+        member = self.worker_config.get((pkt.job_id, pkt.worker_id))
+        if member is None:
+            return []
+        if pkt.flags & FLAG_JOIN:
+            return self.join(pkt, port, job, member, session, now)
+
+        age = (epoch - pkt.epoch) & 0xffff
+        if (job.quorum != job.num_workers or job.deadline != 0) and 0 < age < 0x8000:
+            out = self.unicast_result(pkt, port, job)
+            pkt.add_contrib(0)
+            return out
+        if (received != 0 and pkt.epoch != epoch) or 0 < age < 0x8000:
+            return []
+
+        current_bitmap = 0 if stale else self.worker_bitmap[reg_index]
+        worker_mask = 1 << member
+        if current_bitmap & worker_mask and pkt.epoch == epoch:
+            if received != 0:
+                if job.deadline == 0 or now - self.first_seen[reg_index] < job.deadline:
+                    return []
+                self.load_result(pkt, reg_index)
+                self.worker_count[reg_index] = 0
+                self.result_ready[reg_index] = 1
+                self.agg_partial[reg_index] = current_bitmap
+                out = self.multicast_result(pkt, job)
+                pkt.add_contrib(current_bitmap)
+            elif ready:
+                self.load_result(pkt, reg_index)
+                out = self.unicast_result(pkt, port, job)
+                if partial != 0:
+                    pkt.add_contrib(partial)
+            else:
+                return []   # A leaf waiting for the root
+            overflow = wrapped
+        elif received == 0 and ready and pkt.epoch == epoch:
+            # A late copy of a chunk of the completed use, or a straggler
+            self.load_result(pkt, reg_index)
+            out = self.unicast_result(pkt, port, job)
+            if partial != 0:
+                pkt.add_contrib(partial)
+            overflow = wrapped
+        else:
+            if received == 0:
+                current_bitmap = 0
+            current_bitmap |= worker_mask
+            self.worker_bitmap[reg_index] = current_bitmap
+            self.worker_bitmap[shadow_index] &= ~worker_mask
+
+            overflow = (pkt.flags & FLAG_OVERFLOW) >> 2
+            row = self.agg_value[reg_index, :pkt.count]
+            if received == 0:
+                row[:] = pkt.values
+                self.result_ready[reg_index] = 0
+                self.agg_overflow[reg_index] = overflow
+                self.agg_epoch[reg_index] = pkt.epoch
+                self.first_seen[reg_index] = now & ((1 << 48) - 1)
+                self.agg_partial[reg_index] = 0
+                self.agg_session[reg_index] = session
+            else:
+                values = pkt.values
+                sums = row + values
+                if signed:
+                    carry = ((row ^ sums) & (values ^ sums)) >> 31
+                else:
+                    carry = sums < row
+                if carry.any():
+                    overflow = 1
+                row[:] = sums
+                pkt.values = sums
+                if overflow and not wrapped:
+                    self.agg_overflow[reg_index] = 1
+                overflow |= wrapped
+
+            received = (received + 1) & 0xff
+            if received != job.quorum:
+                self.worker_count[reg_index] = received
+                return []
+            self.worker_count[reg_index] = 0
+            self.result_ready[reg_index] = 1
+            out = self.multicast_result(pkt, job)
+            if received != job.num_workers:
+                self.agg_partial[reg_index] = current_bitmap
+                pkt.add_contrib(current_bitmap)
+
+        if overflow:
+            pkt.flags |= FLAG_OVERFLOW
+        return out
+
+    def join(self, pkt, port, job, member, session, now):
+        """ The rendezvous of MyIngress for a join of `member`, see FLAG_JOIN """
+        j = pkt.job_id
+        nonce_index = j * MAX_WORKERS + member
+        join_mask = 1 << member
+        joined, num_joined = self.join_bitmap[j], self.join_count[j]
+
+        if joined & join_mask and self.join_nonce[nonce_index] == pkt.epoch:
+            if not self.join_released[j]:
+                return []
+            out = self.unicast_result(pkt, port, job)
+            pkt.flags = FLAG_JOIN | FLAG_RESULT
+            pkt.epoch = session
+            return out
+
+        if num_joined == job.num_workers or now - self.join_started[j] >= JOIN_TIMEOUT:
+            joined, num_joined = 0, 0
+            self.join_started[j] = now & ((1 << 48) - 1)
+            self.join_released[j] = 0
+        if not joined & join_mask:
+            joined |= join_mask
+            num_joined += 1
+        self.join_bitmap[j] = joined
+        self.join_count[j] = num_joined
+        self.join_nonce[nonce_index] = pkt.epoch
+        if num_joined != job.num_workers:
+            return []
+        session = (session + 1) & 0xffff
+        self.job_session[j] = session
+        self.join_released[j] = 1
+        out = self.multicast_result(pkt, job)
+        pkt.flags = FLAG_JOIN | FLAG_RESULT
+        pkt.epoch = session
+        return out
+
+    def load_result(self, pkt, reg_index):
+        pkt.values = self.agg_value[reg_index, :pkt.count].copy()
+
+    def multicast_result(self, pkt, job):
+        pkt.flags = FLAG_RESULT
+        pkt.num_workers = job.num_workers
+        return [(port, pkt) for port in self.mcast_groups.get(job.mgid, [])]
+
+    def unicast_result(self, pkt, port, job):
+        pkt.flags = FLAG_RESULT
+        pkt.num_workers = job.num_workers
+        return [(port, pkt)]
+
+    def egress(self, port):
+        """ MyEgress: where results leaving on `port` are addressed to, None if nowhere """
+        return self.result_dst.get(port)
+
+def ingress_port(frame):
+    """ The switch port of the host that sent `frame`, from its source IP 10.0.0.<h + 1> """
+    return frame[ETH_HEADER_SIZE + 15]
+
+def serve(sock, switch, stop=None, loss=0.0, seed=0):
+    """
+    Process the frames arriving on `sock` until `stop` (a threading.Event) is
+    set, losing a `loss` fraction of the frames in either direction
+    """
+    rng = random.Random(seed)
+    sock.settimeout(0.5)
+    while stop is None or not stop.is_set():
+        try:
+            frame, _ = sock.recvfrom(65536)
+        except socket.timeout:
+            continue
+        if loss and rng.random() < loss:
+            continue
+        pkt = parse(frame)
+        if pkt is None:
+            continue
+        now = time.monotonic_ns() // 1000
+        for port, out in switch.ingress(pkt, ingress_port(frame), now):
+            dst = switch.egress(port)
+            if dst is not None and not (loss and rng.random() < loss):
+                sock.sendto(out.pack(), dst)
+
+def run_workers(addr, script, args):
+    """
+    Start `script` with `args` for every rank of every job, one process each
+    and all at once, against the model at `addr` (see lib.launch). Returns
+    the launch report
+    """
+    env = dict(os.environ, APP_SWITCH_MODEL='%s:%d' % addr, APP_NUM_WORKERS=str(NUM_WORKERS))
+
+    def start(h, extra, preexec_fn):
+        return subprocess.Popen([sys.executable, script, str(h % NUM_WORKERS)] + args, preexec_fn=preexec_fn,
+                                env=dict(env, APP_JOB_ID=str(h // NUM_WORKERS), **extra))
+
+    return launch(start, NUM_HOSTS, os.environ['APP_LOGS'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Behavioral model of p4/main.p4 on a local UDP port")
+    parser.add_argument('--addr', default='127.0.0.1', help="address to serve on")
+    parser.add_argument('--port', type=int, default=SWITCHML_PORT, help="UDP port to serve on")
+    parser.add_argument('--loss', type=float, default=0.0, help="fraction of frames to drop")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the loss")
+    parser.add_argument('--run', metavar='SCRIPT', help="run SCRIPT for every rank against the model, then exit")
+    args, rest = parser.parse_known_args()
+    if rest and not args.run:
+        parser.error("unrecognized arguments: %s" % ' '.join(rest))
+
+    errors = check_p4()
+    if errors:
+        sys.exit("The model does not match %s:\n  %s" % (P4_SOURCE, '\n  '.join(errors)))
+
+    switch = SwitchModel()
+    switch.configure()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    sock.bind((args.addr, args.port))
+    print("Switch model of %d job(s) x %d workers on %s:%d" % (NUM_JOBS, NUM_WORKERS, args.addr, args.port))
+
+    if not args.run:
+        serve(sock, switch, loss=args.loss, seed=args.seed)
+        return
+
+    stop = threading.Event()
+    server = threading.Thread(target=serve, args=(sock, switch, stop, args.loss, args.seed), daemon=True)
+    server.start()
+    report = run_workers((args.addr, args.port), args.run, rest)
+    stop.set()
+    server.join()
+    failed = sum(entry['status'] != 0 for entry in report)
+    print(summary(report))
+    print("%d of %d workers failed" % (failed, NUM_HOSTS))
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
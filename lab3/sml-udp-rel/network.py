@@ -20,14 +20,59 @@
  """
 
 from lib import config # do not import anything before this
+from lib.codec import CHUNK_SIZE, NUM_SLOTS, MAX_WORKERS, p4_compile_flags
+from lib.launch import launch, summary
 from p4app import P4Mininet
+from p4_program import P4Program
 from mininet.topo import Topo
 from mininet.cli import CLI
+import subprocess
 import os
 
-NUM_WORKERS = 3 # TODO: Make sure your program can handle larger values
-
-# Simple logic to allocate IP and MAC addresses based on the worker ID
+# Size of the aggregation group (e.g. APP_NUM_WORKERS=32)
+NUM_WORKERS = int(os.environ.get('APP_NUM_WORKERS', 3))
+
+# Independent jobs sharing the switch, each with NUM_WORKERS workers, its own
+# partition of the switch's slots and its own multicast group
+NUM_JOBS = int(os.environ.get('APP_NUM_JOBS', 1))
+MAX_JOBS = 16   # Must match MAX_JOBS in p4/main.p4
+
+# Host h runs worker h % NUM_WORKERS of job h // NUM_WORKERS
+NUM_HOSTS = NUM_JOBS * NUM_WORKERS
+assert 1 <= NUM_JOBS <= MAX_JOBS, "APP_NUM_JOBS must be between 1 and %d" % MAX_JOBS
+assert NUM_HOSTS < 100, "Worker addresses would collide with the switch's 10.0.0.100"
+
+# Two-level topology (e.g. APP_NUM_LEAVES=4): the hosts are spread over leaf
+# switches s2, s3, ..., which aggregate the contributions of their rack and
+# forward the partial sums to the root switch s1. The root combines one
+# contribution per leaf and multicasts the result back down. With 0 leaves
+# all hosts are attached to s1
+NUM_LEAVES = int(os.environ.get('APP_NUM_LEAVES', 0))
+assert 0 <= NUM_LEAVES <= MAX_WORKERS, "APP_NUM_LEAVES must be between 0 and %d" % MAX_WORKERS
+
+# Host h sits in rack h // RACK_SIZE, on port h % RACK_SIZE + 1 of its leaf.
+# Port RACK_SIZE + 1 of every leaf is its uplink, leaf l is on port l + 1 of
+# the root. A switch aggregates at most MAX_WORKERS contributions per job,
+# and the worker id (the rank) must fit into 8 bits
+if NUM_LEAVES:
+    RACK_SIZE = -(-NUM_HOSTS // NUM_LEAVES)
+    assert RACK_SIZE <= MAX_WORKERS, "More than %d hosts per leaf" % MAX_WORKERS
+    assert NUM_WORKERS <= 255, "APP_NUM_WORKERS must be at most 255"
+else:
+    RACK_SIZE = NUM_HOSTS
+    assert 1 <= NUM_WORKERS <= MAX_WORKERS, "APP_NUM_WORKERS must be between 1 and %d" % MAX_WORKERS
+
+# Straggler tolerance (opt-in, single switch only): the switch releases a
+# chunk's partial sum once APP_QUORUM workers contributed (0 = all of them),
+# or on a retransmission APP_DEADLINE_US microseconds after the chunk's first
+# contribution (0 = never). Results carry the bitmap of the workers they contain
+QUORUM = int(os.environ.get('APP_QUORUM', 0)) or NUM_WORKERS
+DEADLINE_US = int(os.environ.get('APP_DEADLINE_US', 0))
+assert 1 <= QUORUM <= NUM_WORKERS, "APP_QUORUM must be between 1 and APP_NUM_WORKERS"
+assert not NUM_LEAVES or (QUORUM == NUM_WORKERS and not DEADLINE_US), \
+    "APP_QUORUM and APP_DEADLINE_US need a single switch"
+
+# Simple logic to allocate IP and MAC addresses based on the host ID
 def getWorkerIP(wid):
     return "10.0.0.%d" % (wid + 1)
 
@@ -44,55 +89,155 @@ class SMLTopo(Topo):
     def __init__(self, **opts):
         Topo.__init__(self, **opts)
 
-        # Create the switch
+        # Create the switch, the root of a two-level topology
         sw = self.addSwitch('s1')
 
+        # Create the leaves
+        leaves = []
+        for l in range(NUM_LEAVES):
+            leaves.append(self.addSwitch('s%d' % (l + 2)))
+            self.addLink(leaves[l], sw, port1=RACK_SIZE+1, port2=l+1)
+
         # Create the workers
-        for i in range(NUM_WORKERS):
+        for i in range(NUM_HOSTS):
             worker = self.addHost(
                 'w%d' % i, ip=getWorkerIP(i), mac=getWorkerMAC(i))
-            self.addLink(worker, sw, port2=i+1)  # Start from port 1
+            if NUM_LEAVES:
+                self.addLink(worker, leaves[i // RACK_SIZE], port2=i % RACK_SIZE + 1)
+            else:
+                self.addLink(worker, sw, port2=i+1)  # Start from port 1
 
-def RunWorkers(net):
+def RunWorkers(net, script='worker.py'):
     """
-    Starts the workers and waits for their completion.
+    Starts the workers at once and waits for their completion.
+    Every worker runs `script`, e.g. 'bench.py' instead of 'worker.py'.
+    Workers are pinned to a CPU each and start sending together, once all
+    of them created their sockets (see lib/launch.py). The launch times and
+    exit status of every worker are printed and saved to logs/launch.json.
     Redirects output to logs/<worker_name>.log (see lib/worker.py, Log())
-    This function assumes worker i is named 'w<i>'. Feel free to modify it
+    This function assumes host i is named 'w<i>'. Feel free to modify it
     if your naming scheme is different
     """
     worker = lambda rank: "w%i" % rank
     log_file = lambda rank: os.path.join(os.environ['APP_LOGS'], "%s.log" % worker(rank))
 
-    # Build environment string
-    env_vars = []
-    for key in ['APP_LOGS', 'APP_TEST', 'APP_ROOT']:
-        if key in os.environ:
-            env_vars.append(f'{key}={os.environ[key]}')
+    # Workers must use the payload width and slot pool the switch was compiled for
+    env = dict(os.environ, APP_CHUNK_SIZE=str(CHUNK_SIZE), APP_NUM_SLOTS=str(NUM_SLOTS),
+               APP_NUM_WORKERS=str(NUM_WORKERS))
 
-    env_string = ' '.join(env_vars)
+    def start(i, extra, preexec_fn):
+        with open(log_file(i), 'w') as log:
+            return net.get(worker(i)).popen(['python', script, str(i % NUM_WORKERS)], stdout=log,
+                                            stderr=subprocess.STDOUT, preexec_fn=preexec_fn,
+                                            env=dict(env, APP_JOB_ID=str(i // NUM_WORKERS), **extra))
 
-    for i in range(NUM_WORKERS):
-        # Run with environment variables set inline
-        cmd = f'{env_string} python worker.py {i} > {log_file(i)} 2>&1'
-        net.get(worker(i)).sendCmd(cmd)
+    report = launch(start, NUM_HOSTS, os.environ['APP_LOGS'])
+    print(summary(report))
+    failed = [worker(e['host']) for e in report if e['status'] != 0]
+    if failed:
+        print("Failed workers: %s" % ', '.join(failed))
+    return report
 
-    for i in range(NUM_WORKERS):
-        net.get(worker(i)).waitOutput()
+def ConfigureJob(sw, job, num_workers, mgid, ports, members, leaf=None, quorum=None, deadline_us=0):
+    """
+    Installs a job on switch `sw`: a multicast group over `ports` for the
+    results, the number of contributions per chunk and the slot partition
+    of the job, and the contributors, a dict from worker_id to their bit in
+    the contribution bitmap. On a leaf, `leaf` is its (leaf_id, uplink_port).
+    Elsewhere `quorum` and `deadline_us` may release results early
+    """
+    sw.addMulticastGroup(mgid=mgid, ports=ports)
+    print(f"Created multicast group {mgid} for job {job} on {sw.name} with ports: {ports}")
+
+    params = {'num_workers': num_workers,
+              'slot_base': job * NUM_SLOTS,
+              'num_slots': NUM_SLOTS,
+              'mgid': mgid}
+    if leaf is None:
+        action = 'MyIngress.set_job'
+        params['quorum'] = quorum or num_workers
+        params['deadline'] = deadline_us
+    else:
+        action = 'MyIngress.set_leaf_job'
+        params['leaf_id'], params['uplink_port'] = leaf
+    sw.insertTableEntry(table_name='MyIngress.job_config',
+                        match_fields={'hdr.switchml.job_id': job},
+                        action_name=action,
+                        action_params=params)
+
+    for worker_id, member in members.items():
+        sw.insertTableEntry(table_name='MyIngress.worker_config',
+                            match_fields={'hdr.switchml.job_id': job,
+                                          'hdr.switchml.worker_id': worker_id},
+                            action_name='MyIngress.set_member',
+                            action_params={'member': member})
 
 def RunControlPlane(net):
     """
     One-time control plane configuration
     """
-    sw = net.get('s1')
-
-    # Create multicast group for broadcasting aggregation results
-    # Include all worker ports (1 to NUM_WORKERS)
-    worker_ports = list(range(1, NUM_WORKERS + 1))
-    sw.addMulticastGroup(mgid=1, ports=worker_ports)
-    print(f"Created multicast group 1 with ports: {worker_ports}")
+    root = net.get('s1')
+
+    for job in range(NUM_JOBS):
+        # One multicast group per job for broadcasting aggregation results.
+        # Host h runs worker h - first of the job
+        mgid = job + 1
+        first = job * NUM_WORKERS
+        hosts = range(first, first + NUM_WORKERS)
+
+        if not NUM_LEAVES:
+            # The workers contribute directly, host h is on port h + 1
+            ConfigureJob(root, job, NUM_WORKERS, mgid,
+                         ports=[h + 1 for h in hosts],
+                         members={h - first: h - first for h in hosts},
+                         quorum=QUORUM, deadline_us=DEADLINE_US)
+            continue
+
+        # Each leaf aggregates the workers in its rack, and contributes to
+        # the root as worker_id leaf_id
+        racks = sorted(set(h // RACK_SIZE for h in hosts))
+        for l in racks:
+            local = [h for h in hosts if h // RACK_SIZE == l]
+            ConfigureJob(net.get('s%d' % (l + 2)), job, len(local), mgid,
+                         ports=[h % RACK_SIZE + 1 for h in local],
+                         members={h - first: h % RACK_SIZE for h in local},
+                         leaf=(l, RACK_SIZE + 1))
+        ConfigureJob(root, job, len(racks), mgid,
+                     ports=[l + 1 for l in racks],
+                     members={l: l for l in racks})
+
+    # Address results to the worker behind each port, which receives on
+    # UDP port 10000 + h (see get_worker_port() in worker.py)
+    for h in range(NUM_HOSTS):
+        sw = net.get('s%d' % (h // RACK_SIZE + 2)) if NUM_LEAVES else root
+        sw.insertTableEntry(table_name='MyEgress.result_dst',
+                            match_fields={'standard_metadata.egress_port': h % RACK_SIZE + 1},
+                            action_name='MyEgress.set_result_dst',
+                            action_params={'mac': getWorkerMAC(h),
+                                           'ip': getWorkerIP(h),
+                                           'port': 10000 + h})
+
+    # Host to host traffic (the ring AllReduce) goes down to the host's port
+    # on its own leaf and up the uplink on the others, the root sends it to
+    # the host's leaf
+    for h in range(NUM_HOSTS):
+        match = {'hdr.ipv4.dstAddr': getWorkerIP(h)}
+        params = {'dst_mac': getWorkerMAC(h)}
+        if not NUM_LEAVES:
+            root.insertTableEntry(table_name='MyIngress.ipv4_forward', match_fields=match,
+                                  action_name='MyIngress.forward', action_params={**params, 'port': h + 1})
+            continue
+        root.insertTableEntry(table_name='MyIngress.ipv4_forward', match_fields=match,
+                              action_name='MyIngress.forward',
+                              action_params={**params, 'port': h // RACK_SIZE + 1})
+        for l in range(NUM_LEAVES):
+            port = h % RACK_SIZE + 1 if h // RACK_SIZE == l else RACK_SIZE + 1
+            net.get('s%d' % (l + 2)).insertTableEntry(table_name='MyIngress.ipv4_forward', match_fields=match,
+                                                      action_name='MyIngress.forward',
+                                                      action_params={**params, 'port': port})
 
     # Configure hosts for raw socket access
-    for i in range(NUM_WORKERS):
+    for i in range(NUM_HOSTS):
         worker = net.get(f'w{i}')
 
         # Debug: show interface info
@@ -118,6 +263,11 @@ def RunControlPlane(net):
         worker.cmd('sysctl -w net.ipv6.conf.all.disable_ipv6=1 2>/dev/null || true')
         worker.cmd('sysctl -w net.ipv6.conf.eth0.disable_ipv6=1 2>/dev/null || true')
 
+        # The switches do not answer ARP, the other hosts' addresses are static
+        for h in range(NUM_HOSTS):
+            if h != i:
+                worker.cmd(f'ip neigh replace {getWorkerIP(h)} lladdr {getWorkerMAC(h)} dev eth0')
+
         # Add route for broadcast
         worker.cmd('ip route add 10.0.0.255/32 dev eth0')
 
@@ -132,9 +282,10 @@ def RunControlPlane(net):
     print("Control plane configuration completed")
 
 topo = SMLTopo()
-net = P4Mininet(program="p4/main.p4", topo=topo)
+program = P4Program("p4/main.p4", compile_flags=p4_compile_flags(NUM_JOBS))
+net = P4Mininet(program=program, topo=topo)
 net.run_control_plane = lambda: RunControlPlane(net)
-net.run_workers = lambda: RunWorkers(net)
+net.run_workers = lambda script='worker.py': RunWorkers(net, script)
 net.start()
 net.run_control_plane()
 CLI(net)
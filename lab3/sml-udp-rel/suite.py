@@ -0,0 +1,202 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""
+    AllReduce benchmark suite
+
+    Runs bench.py for every combination of the swept settings against the
+    switch model (model.py, one process per rank), and writes one record per
+    combination to a JSON and a CSV file:
+
+        python suite.py --sizes 1K,64K,1M,16M --workers 2,4,8 --chunk-sizes 32,64 \
+                        --windows 16,64 --loss 0,0.01 --out logs/suite
+
+    A record holds the settings, the p50 and p99 time per iteration (the
+    slowest rank's call), elements per second and goodput (input bytes per
+    worker and second) at the mean iteration time, and the retransmissions
+    of all ranks. --transports switch,ring adds the host ring as a baseline.
+    --impair sweeps impairments of the frames the workers send, e.g.
+    --impair "ge_p=0.01,ge_r=0.25;delay_ms=1,jitter_ms=1,reorder=0.05" (see
+    lib.comm.Impairment.from_spec), which are seeded, so reruns lose the
+    same frames.
+
+    Compare a run with a stored baseline; records slower by more than the
+    threshold are flagged and the exit status is 1:
+
+        python suite.py --compare logs/suite/baseline.json logs/suite/results.json
+"""
+
+import argparse
+import csv
+import glob
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Settings that identify a record, and the metrics compared against a baseline
+KEYS = ('transport', 'elems', 'workers', 'chunk_size', 'window', 'loss', 'impair')
+FIELDS = KEYS + ('iters', 'p50_ms', 'p99_ms', 'elems_per_s', 'goodput_mbps', 'retransmits', 'ok')
+
+def parse_size(text):
+    """ '64K' -> 65536, '16M' -> 16777216 """
+    scale = {'K': 1 << 10, 'M': 1 << 20}.get(text[-1:].upper(), 1)
+    return int(text[:-1] if scale > 1 else text) * scale
+
+def parse_list(text, kind=int):
+    return [kind(item) for item in text.split(',') if item]
+
+def run_one(transport, elems, workers, chunk_size, window, loss, impair, iters, warmup, logs, timeout):
+    """ Run bench.py once for every rank, returns its record """
+    record = dict(transport=transport, elems=elems, workers=workers, chunk_size=chunk_size,
+                  window=window, loss=loss, impair=impair, iters=iters, ok=False)
+    shutil.rmtree(logs, ignore_errors=True)
+    os.makedirs(logs)
+    env = dict(os.environ, APP_NUM_WORKERS=str(workers), APP_CHUNK_SIZE=str(chunk_size), APP_NUM_JOBS='1')
+    env.setdefault('APP_LOG_LEVEL', 'WARNING')
+    if impair:
+        env['APP_IMPAIR'] = impair
+    cmd = [sys.executable, os.path.join(HERE, 'model.py'), '--loss', str(loss), '--run', 'bench.py',
+           '--transport', transport, '--elems', str(elems), '--iters', str(iters), '--warmup', str(warmup),
+           '--window', str(window), '--logs', logs]
+    try:
+        status = subprocess.run(cmd, cwd=HERE, env=env, timeout=timeout,
+                                stdout=subprocess.DEVNULL).returncode
+    except subprocess.TimeoutExpired:
+        print("  timed out after %ds" % timeout)
+        return record
+    results = []
+    for path in glob.glob(os.path.join(logs, 'bench-*.json')):
+        with open(path) as f:
+            results.append(json.load(f))
+    if status != 0 or len(results) != workers:
+        return record
+
+    # An iteration takes as long as its slowest rank
+    seconds = np.max([r['call_us'] for r in results], axis=0) / 1e6
+    mean = float(np.mean(seconds))
+    record.update(ok=True,
+                  p50_ms=float(np.percentile(seconds, 50)) * 1e3,
+                  p99_ms=float(np.percentile(seconds, 99)) * 1e3,
+                  elems_per_s=elems / mean,
+                  goodput_mbps=elems * 4 * 8 / mean / 1e6,
+                  retransmits=int(sum(sum(r.get('retransmits', [])) for r in results)))
+    return record
+
+def sweep(args):
+    records = []
+    combos = list(itertools.product(args.transports, args.sizes, args.workers, args.chunk_sizes,
+                                    args.windows, args.loss, args.impair))
+    for i, (transport, elems, workers, chunk_size, window, loss, impair) in enumerate(combos):
+        if transport == 'ring' and (chunk_size, window, loss, impair) != (args.chunk_sizes[0], args.windows[0],
+                                                                         args.loss[0], args.impair[0]):
+            continue    # The ring has none of these settings, run it once
+        print("[%d/%d] %s: %d elements, %d workers, chunk %d, window %d, loss %g%s"
+              % (i + 1, len(combos), transport, elems, workers, chunk_size, window, loss,
+                 ", impair " + impair if impair else ""))
+        record = run_one(transport, elems, workers, chunk_size, window, loss, impair, args.iters,
+                         args.warmup, os.path.join(args.out, 'run'), args.timeout)
+        if record['ok']:
+            print("  p50 %.2fms, p99 %.2fms, %.3g elements/s, %.1f Mbit/s, %d retransmissions"
+                  % (record['p50_ms'], record['p99_ms'], record['elems_per_s'], record['goodput_mbps'],
+                     record['retransmits']))
+        else:
+            print("  FAILED")
+        records.append(record)
+    shutil.rmtree(os.path.join(args.out, 'run'), ignore_errors=True)
+
+    with open(os.path.join(args.out, 'results.json'), 'w') as f:
+        json.dump(records, f, indent=1)
+    with open(os.path.join(args.out, 'results.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    print("Wrote %s/results.json and results.csv" % args.out)
+    return 0 if all(r['ok'] for r in records) else 1
+
+def compare(baseline_path, results_path, threshold):
+    """ Flag records whose p50, p99 or elements/s got worse than `threshold` allows """
+    with open(baseline_path) as f:
+        baseline = {tuple(r.get(k, '') for k in KEYS): r for r in json.load(f)}
+    with open(results_path) as f:
+        results = json.load(f)
+
+    regressions = 0
+    for record in results:
+        key = tuple(record.get(k, '') for k in KEYS)
+        base = baseline.get(key)
+        if base is None or not base['ok']:
+            continue
+        label = "%s %d elements, %d workers, chunk %d, window %d, loss %g" % key[:-1]
+        if key[-1]:
+            label += ", impair " + key[-1]
+        if not record['ok']:
+            print("REGRESSION %s: failed" % label)
+            regressions += 1
+            continue
+        for metric, worse in (('p50_ms', 1), ('p99_ms', 1), ('elems_per_s', -1)):
+            change = (record[metric] - base[metric]) / base[metric]
+            if worse * change > threshold:
+                print("REGRESSION %s: %s %.4g -> %.4g (%+.0f%%)" % (label, metric, base[metric],
+                                                                   record[metric], 100 * change))
+                regressions += 1
+    print("%d regressions in %d records" % (regressions, len(results)))
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="AllReduce benchmark suite against the switch model")
+    parser.add_argument('--sizes', default='1K,64K,1M', help="vector sizes, e.g. 1K,64K,1M,16M")
+    parser.add_argument('--workers', default='2,4,8', help="group sizes")
+    parser.add_argument('--chunk-sizes', default='32', help="values per packet (one of 4..256)")
+    parser.add_argument('--windows', default='16', help="chunks in flight")
+    parser.add_argument('--loss', default='0', help="fraction of frames the model drops")
+    parser.add_argument('--impair', default='', help="impairments of sent frames, separated by ';'")
+    parser.add_argument('--transports', default='switch', help="switch and/or ring")
+    parser.add_argument('--iters', type=int, default=10, help="measured iterations per record")
+    parser.add_argument('--warmup', type=int, default=2, help="iterations before measuring")
+    parser.add_argument('--timeout', type=int, default=600, help="seconds allowed per record")
+    parser.add_argument('--out', default=os.path.join(HERE, 'logs', 'suite'), help="output directory")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'),
+                        help="flag regressions of RESULTS against BASELINE instead")
+    parser.add_argument('--threshold', type=float, default=0.1, help="tolerated relative slowdown")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+
+    args.sizes = parse_list(args.sizes, parse_size)
+    args.workers = parse_list(args.workers)
+    args.chunk_sizes = parse_list(args.chunk_sizes)
+    args.windows = parse_list(args.windows)
+    args.loss = parse_list(args.loss, float)
+    args.transports = parse_list(args.transports, str)
+    args.impair = args.impair.split(';')
+    os.makedirs(args.out, exist_ok=True)
+    sys.exit(sweep(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Draining a receive socket into lib.batchio.RecvRing
+
+        python -m unittest discover -s tests     (or python -m pytest tests)
+"""
+
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.batchio import RecvRing
+
+class FailingSocket:
+    """ A socket whose recv_into() raises `error` once `count` datagrams were received """
+
+    def __init__(self, sock, count, error):
+        self.sock = sock
+        self.count = count
+        self.error = error
+
+    def recv_into(self, buf):
+        if self.count == 0:
+            raise self.error
+        self.count -= 1
+        return self.sock.recv_into(buf)
+
+class RecvRingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.send, self.recv = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.recv.setblocking(False)
+        self.ring = RecvRing(4, 16)
+
+    def tearDown(self):
+        self.send.close()
+        self.recv.close()
+
+    def packets(self, count):
+        return [bytes(self.ring.packet(i)) for i in range(count)]
+
+    def test_drain_until_empty(self):
+        for data in (b'a', b'bb', b'ccc'):
+            self.send.send(data)
+        self.assertEqual(self.ring.drain(self.recv), 3)
+        self.assertEqual(self.packets(3), [b'a', b'bb', b'ccc'])
+        self.assertIsNone(self.ring.error)
+
+    def test_drain_until_full(self):
+        for i in range(6):
+            self.send.send(bytes([i]))
+        self.assertEqual(self.ring.drain(self.recv), 4)
+        self.assertEqual(self.ring.drain(self.recv), 2)
+        self.assertEqual(self.packets(2), [b'\x04', b'\x05'])
+
+    def test_error_keeps_received_datagrams(self):
+        for data in (b'a', b'bb', b'ccc'):
+            self.send.send(data)
+        error = ConnectionRefusedError()
+        self.assertEqual(self.ring.drain(FailingSocket(self.recv, 2, error)), 2)
+        self.assertEqual(self.packets(2), [b'a', b'bb'])
+        self.assertIs(self.ring.error, error)
+
+        # The error is cleared by the next drain, which gets the rest
+        self.assertEqual(self.ring.drain(self.recv), 1)
+        self.assertEqual(self.packets(1), [b'ccc'])
+        self.assertIsNone(self.ring.error)
+
+if __name__ == '__main__':
+    unittest.main()
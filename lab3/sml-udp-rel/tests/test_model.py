@@ -0,0 +1,154 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Packet interleavings against the behavioral model of the switch
+
+        python -m unittest discover -s tests     (or python -m pytest tests)
+
+    The model is configured from the environment at import, so the group
+    and slot pool are fixed here: 2 workers, 2 slots of 4 values. Chunk
+    number seq uses slot seq % 2, copy (seq // 2) % 2 and epoch seq // 4.
+    Quorum and deadline are set per test in the job's configuration.
+"""
+
+import os
+import sys
+import unittest
+
+os.environ.update(APP_NUM_WORKERS='2', APP_NUM_JOBS='1', APP_NUM_SLOTS='2', APP_CHUNK_SIZE='4',
+                  APP_QUORUM='0', APP_DEADLINE_US='0', APP_NUM_LEAVES='0')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import model
+import worker
+from lib.codec import HEADER, NUM_SLOTS, FLAG_RESULT, FLAG_PARTIAL, slot_field
+
+def chunk(worker, seq, value):
+    """ Worker `worker`'s contribution to chunk number `seq`, all 4 values set to `value` """
+    payload = HEADER.pack(worker, seq & 0xff, 2, 0, 4, slot_field(seq), 0, seq // (2 * NUM_SLOTS))
+    return model.Packet(payload + np.full(4, value, dtype='>u4').tobytes())
+
+class InterleavingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.switch = model.SwitchModel()
+        self.switch.configure()
+        self.now = 0
+
+    def send(self, worker, seq, value):
+        """ The (egress port, values) of the results the switch sends for the contribution """
+        self.now += 10
+        out = self.switch.ingress(chunk(worker, seq, value), worker + 1, self.now)
+        for port, pkt in out:
+            self.assertTrue(pkt.flags & FLAG_RESULT)
+        return [(port, pkt.values.tolist()) for port, pkt in out]
+
+    def test_complete_use(self):
+        self.assertEqual(self.send(0, 0, 1), [])
+        self.assertEqual(self.send(1, 0, 2), [(1, [3] * 4), (2, [3] * 4)])
+
+    def test_late_duplicate_after_sender_moved_on(self):
+        # A copy of w0's chunk 0 arrives after w0 used the other copy of the
+        # slot, which cleared its bit in the bitmap of chunk 0's copy
+        self.send(0, 0, 1)
+        self.send(1, 0, 2)
+        self.assertEqual(self.send(0, 2, 10), [])
+        self.assertEqual(self.send(0, 0, 1), [(1, [3] * 4)])
+        self.assertEqual(self.send(1, 2, 20), [(1, [30] * 4), (2, [30] * 4)])
+
+        # Chunk 4 reuses chunk 0's copy: it is neither stuck nor mixed with chunk 0
+        self.assertEqual(self.send(0, 4, 100), [])
+        self.assertEqual(self.send(1, 4, 200), [(1, [300] * 4), (2, [300] * 4)])
+
+    def test_late_duplicate_after_next_use(self):
+        # A copy of w0's chunk 0 arrives once chunk 4 completed in the same copy
+        for seq in (0, 2, 4):
+            self.send(0, seq, 1)
+            self.send(1, seq, 2)
+        self.assertEqual(self.send(0, 0, 1), [])
+        self.assertEqual(self.send(0, 6, 5), [])
+        self.assertEqual(self.send(0, 8, 7), [])
+        self.assertEqual(self.send(1, 8, 8), [(1, [15] * 4), (2, [15] * 4)])
+
+    def test_retransmission_after_result(self):
+        self.send(0, 0, 1)
+        self.send(1, 0, 2)
+        self.assertEqual(self.send(1, 0, 2), [(2, [3] * 4)])
+
+class PartialTest(unittest.TestCase):
+    """ Results released without every worker carry the bitmap of those they contain """
+
+    def configure(self, quorum, deadline):
+        self.switch = model.SwitchModel()
+        self.switch.configure()
+        self.switch.job_config[0] = self.switch.job_config[0]._replace(quorum=quorum, deadline=deadline)
+
+    def send(self, worker, seq, value, now):
+        """ The (egress port, values, bitmap) of the results the switch sends, bitmap None if complete """
+        out = self.switch.ingress(chunk(worker, seq, value), worker + 1, now)
+        for port, pkt in out:
+            self.assertTrue(pkt.flags & FLAG_RESULT)
+            self.assertEqual(pkt.contrib is not None, bool(pkt.flags & FLAG_PARTIAL))
+        return [(port, pkt.values.tolist(), pkt.contrib) for port, pkt in out]
+
+    def test_quorum_release(self):
+        self.configure(quorum=1, deadline=0)
+        self.assertEqual(self.send(0, 0, 1, 10), [(1, [1] * 4, 0b01), (2, [1] * 4, 0b01)])
+
+        # The straggler gets the released sum, which does not contain it
+        self.assertEqual(self.send(1, 0, 2, 20), [(2, [1] * 4, 0b01)])
+
+    def test_complete_use_with_quorum(self):
+        self.configure(quorum=2, deadline=0)
+        self.assertEqual(self.send(0, 0, 1, 10), [])
+        self.assertEqual(self.send(1, 0, 2, 20), [(1, [3] * 4, None), (2, [3] * 4, None)])
+
+    def test_deadline_release(self):
+        self.configure(quorum=2, deadline=100)
+        self.assertEqual(self.send(0, 0, 1, 10), [])
+        # A retransmission before the deadline still waits for worker 1
+        self.assertEqual(self.send(0, 0, 1, 60), [])
+        self.assertEqual(self.send(0, 0, 1, 110), [(1, [1] * 4, 0b01), (2, [1] * 4, 0b01)])
+        self.assertEqual(self.send(1, 0, 2, 120), [(2, [1] * 4, 0b01)])
+
+    def test_straggler_after_reuse(self):
+        # Once the copy of chunk 0 was reused, worker 1's chunk 0 comes back
+        # with an empty bitmap: the values are its own, not a sum
+        self.configure(quorum=1, deadline=0)
+        self.send(0, 0, 1, 10)
+        self.send(0, 2, 1, 20)
+        self.assertEqual(self.send(0, 4, 5, 30), [(1, [5] * 4, 0b01), (2, [5] * 4, 0b01)])
+        self.assertEqual(self.send(1, 0, 2, 40), [(2, [2] * 4, 0)])
+
+        # Nor did it add to chunk 4
+        self.assertEqual(self.send(0, 4, 5, 50), [(1, [5] * 4, 0b01)])
+
+    def test_rescale(self):
+        # A quorum sum of worker 0 is scaled to both workers, a full sum is kept
+        self.configure(quorum=1, deadline=0)
+        [(_, values, contrib)] = self.send(0, 0, 3, 10)[:1]
+        self.assertEqual(list(worker.rescale(values, [contrib] * 4, 2)), [6.0] * 4)
+        self.assertEqual(list(worker.rescale([3, 4], [0b01, 0b11], 2)), [6.0, 4.0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Error bounds of the block-scaled quantization in lib/quant.py
+
+        python -m unittest discover -s tests     (or python -m pytest tests)
+
+    The switch is replaced by a NumPy model of its signed addition, which
+    adds the workers' words in turn and flags a chunk as overflowed when
+    some partial sum wraps, like p4/main.p4.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from lib.quant import BlockQuantizer, QUANT_BLOCK
+
+CHUNK = 32   # Values per packet, the granularity of overflow flags
+
+def add(words, signed=True):
+    """
+    The switch's sums of the workers' `words`, as two's complement values or
+    unsigned ones, and the indices of the chunks that overflowed
+    """
+    low = -2**31 if signed else 0
+    total = np.zeros(len(words[0]), dtype=np.int64)
+    wrapped = np.zeros(len(words[0]), dtype=bool)
+    for w in words:
+        w = np.asarray(w, dtype=np.uint32)
+        total += w.view(np.int32) if signed else w
+        wrapped |= (total < low) | (total >= low + 2**32)
+        total = (total - low) % 2**32 + low
+    chunks = np.flatnonzero(np.pad(wrapped, (0, -len(wrapped) % CHUNK)).reshape(-1, CHUNK).any(axis=1))
+    return (total & 0xffffffff).astype(np.uint32), chunks
+
+def reduce_exchange(quant, inputs):
+    """ The float sums of an AllReduce with the exponent pass, and their error bounds """
+    bounds, overflowed = add([quant.bounds(x) for x in inputs], signed=False)
+    assert len(overflowed) == 0
+    shift = quant.shifts(bounds)
+    sums, overflowed = add([quant.encode(x, shift) for x in inputs])
+    assert len(overflowed) == 0, "the exchanged scale overflowed"
+    n = len(inputs[0])
+    return quant.decode(sums, shift), quant.value_bounds(shift, n)
+
+def reduce_fixed(quant, inputs):
+    """
+    The float sums of an AllReduce at the fixed scale, whose overflowed
+    chunks are sent again at the safe one, their error bounds and the number
+    of chunks sent again
+    """
+    n = len(inputs[0])
+    shift = quant.fixed_shift()
+    sums, overflowed = add([quant.encode(x, shift) for x in inputs])
+    values, errors = quant.decode(sums, shift), quant.value_bounds(shift, n)
+    if len(overflowed):
+        index = (overflowed[:, None] * CHUNK + np.arange(CHUNK)).reshape(-1)
+        index = index[index < n]
+        safe = quant.fixed_shift(safe=True)
+        sums, again = add([quant.encode(np.asarray(x)[index], safe) for x in inputs])
+        assert len(again) == 0, "the safe scale overflowed"
+        values[index] = quant.decode(sums, safe)
+        errors[index] = quant.error_bound(safe)
+    return values, errors, len(overflowed)
+
+def distributions(rng, n):
+    """ Named generators of one worker's input vector of `n` values """
+    def mixed():
+        # Values around 1 and around 1e-6 share every block
+        x = rng.uniform(0.5, 1.5, n)
+        x[::2] *= 1e-6
+        return x
+    def sparse():
+        x = rng.normal(0, 1, n)
+        x[:QUANT_BLOCK] = 0
+        return x
+    return {
+        'uniform': lambda: rng.uniform(0, 1, n),     # like lib.gen.GenFloats
+        'normal': lambda: rng.normal(0, 1, n),
+        'mixed': mixed,
+        'wide': lambda: 10 ** rng.uniform(-8, 2, n) * rng.choice([-1, 1], n),
+        'sparse': sparse,
+        'large': lambda: rng.uniform(-200, 200, n),
+    }
+
+class QuantizerTest(unittest.TestCase):
+
+    N = 3 * QUANT_BLOCK + 17    # a partial last block
+
+    def cases(self):
+        for num_workers in (2, 3, 8, 64):
+            quant = BlockQuantizer(num_workers)
+            rng = np.random.default_rng(num_workers)
+            for name, gen in distributions(rng, self.N).items():
+                inputs = [gen() for _ in range(num_workers)]
+                expected = np.sum([np.clip(x, -quant.limit, quant.limit) for x in inputs], axis=0)
+                yield "%s, %d workers" % (name, num_workers), quant, inputs, expected
+
+    def assertWithin(self, values, expected, errors, label):
+        excess = np.abs(values - expected) - errors
+        self.assertLessEqual(excess.max(), 0, "%s: error above the bound at %d" % (label, excess.argmax()))
+
+    def test_exchange_within_bound(self):
+        for label, quant, inputs, expected in self.cases():
+            values, errors = reduce_exchange(quant, inputs)
+            self.assertWithin(values, expected, errors, label)
+
+    def test_fixed_shift_within_bound(self):
+        resent = 0
+        for label, quant, inputs, expected in self.cases():
+            values, errors, chunks = reduce_fixed(quant, inputs)
+            self.assertWithin(values, expected, errors, label)
+            resent += chunks
+        self.assertGreater(resent, 0, "no case took the overflow path")
+
+    def test_mixed_magnitudes_lose_relative_precision(self):
+        # Values around 1e-6 next to values around 1 keep only their
+        # absolute bound, far from RunFloatTest's default rel_tol of 1e-4
+        quant = BlockQuantizer(3)
+        rng = np.random.default_rng(0)
+        inputs = [distributions(rng, self.N)['mixed']() for _ in range(3)]
+        values, errors = reduce_exchange(quant, inputs)
+        expected = np.sum(inputs, axis=0)
+        small = slice(0, None, 2)
+        self.assertGreater((np.abs(values - expected) / expected)[small].max(), 1e-4)
+        self.assertWithin(values, expected, errors, "mixed")
+
+class RunFloatTestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = os.environ.get('APP_TEST')
+        os.environ['APP_TEST'] = self.tmp.name
+
+    def tearDown(self):
+        if self.env is None:
+            del os.environ['APP_TEST']
+        else:
+            os.environ['APP_TEST'] = self.env
+        self.tmp.cleanup()
+
+    def run_test(self, testid, values, **kwargs):
+        from lib.test import RunFloatTest
+        RunFloatTest(testid, 0, values.tolist(), **kwargs)
+        with open(os.path.join(self.tmp.name, 'test-%s' % testid, 'result-rank-0.txt')) as f:
+            return f.read()
+
+    def test_abs_tol_from_error_bound(self):
+        from lib.test import CreateTestData
+        quant = BlockQuantizer(2)
+        rng = np.random.default_rng(1)
+        inputs = [distributions(rng, QUANT_BLOCK)['mixed']() for _ in range(2)]
+        for rank, x in enumerate(inputs):
+            CreateTestData('mixed', rank, x.tolist())
+        values, errors = reduce_exchange(quant, inputs)
+
+        self.assertIn("FAIL", self.run_test('mixed', values))
+        self.assertIn("PASS", self.run_test('mixed', values, abs_tol=float(errors.max())))
+
+if __name__ == '__main__':
+    unittest.main()
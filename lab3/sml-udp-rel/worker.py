@@ -19,294 +19,792 @@
  CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
  """
 
-from lib.gen import GenInts, GenMultipleOfInRange
-from lib.test import CreateTestData, RunIntTest
+from lib.gen import GenInts, GenFloats, GenMultipleOfInRange
+from lib.test import CreateTestData, RunIntTest, RunFloatTest
 from lib.worker import *
-from lib.comm import unreliable_send, unreliable_receive
+from lib.comm import Impairment
+from lib.codec import CHUNK_SIZE, NUM_SLOTS, FLAG_RESULT, FLAG_SIGNED, FLAG_OVERFLOW, FLAG_JOIN
+from lib.codec import VectorCodec, unpack_header, contributors, payload_size, join_payload, CONTRIB, MAX_WORKERS
+from lib.frame import FrameTemplate
+from lib.batchio import BatchSender, ImpairedSender, RecvRing
+from lib.timers import TimerHeap, RttEstimator
+from lib.quant import BlockQuantizer
+from lib.ring import Ring
+from lib import launch
+from lib import sparse
+import numpy as np
+import asyncio
 import socket
-import struct
-import time
-import random
 import os
 
 NUM_ITER   = 1     # TODO: Make sure your program can handle larger values
-CHUNK_SIZE = 4     # Number of 32-bit values per chunk
+
+# Size of the aggregation group and the job it belongs to, passed on by network.py
+NUM_WORKERS = int(os.environ.get('APP_NUM_WORKERS', 3))
+JOB_ID = int(os.environ.get('APP_JOB_ID', 0))
 
 # Network configuration
 SWITCHML_PORT = 9999      # UDP port for SwitchML protocol
-TIMEOUT = 1.0             # Timeout for retransmission in seconds
+SWITCH_MAC = "00:00:00:00:01:00"
+SWITCH_IP = "10.0.0.100"
+# Behavioral model of the switch to send frames to instead of eth0, e.g.
+# APP_SWITCH_MODEL=127.0.0.1:9999 (see model.py). All workers share its host
+SWITCH_MODEL = os.environ.get('APP_SWITCH_MODEL', '')
+# Impairments of the packets sent to the switch, e.g.
+# APP_IMPAIR=loss=0.01,delay_ms=1,seed=7 (see lib.comm.Impairment.from_spec)
+IMPAIR = os.environ.get('APP_IMPAIR', '')
+STARTUP_DELAY = 0.5       # Seconds to give all workers time to start without the rendezvous
+INITIAL_RTO = 1.0         # Retransmission timeout before the first RTT sample, in seconds
+MIN_RTO = 0.01            # Floor for the adaptive retransmission timeout
+MAX_RTO = 2.0             # Cap for the retransmission timeout, including backoff
 MAX_RETRIES = 10          # Maximum number of retransmission attempts
 
+# Sliding window configuration
+WINDOW_SIZE = 16          # Default number of chunks in flight
+CHUNK_ID_SPACE = 256      # chunk_id is 8 bits on the wire
+MAX_WINDOW = NUM_SLOTS    # A slot is only reused once its previous result arrived
+RECV_BATCH = 32           # Results received per wakeup by the event loop
+
+_next_chunk_seq = 0       # Sequence number of the next chunk across AllReduce calls
+
+# Rendezvous at the switch before the first chunk, see SwitchMLEndpoint.rendezvous().
+# APP_RENDEZVOUS=0 falls back to STARTUP_DELAY, e.g. for a switch without it
+RENDEZVOUS = os.environ.get('APP_RENDEZVOUS', '1') != '0'
+JOIN_RETRY = 0.1          # Seconds between joins until the switch releases the job
+JOIN_TIMEOUT = 10.0       # Seconds after which a worker starts without the others
+_run_nonce = int.from_bytes(os.urandom(2), 'big')   # This run of the worker, for the switch
+
+# Transport selection, see select_transport(). APP_TRANSPORT=switch or ring
+# forces one; by default groups of up to RING_MAX_WORKERS reduce vectors of
+# at least RING_MIN_ELEMS values over the host ring, which moves a whole
+# segment per system call where the switch takes one packet per CHUNK_SIZE
+TRANSPORT = os.environ.get('APP_TRANSPORT', 'auto')
+RING_MAX_WORKERS = int(os.environ.get('APP_RING_MAX_WORKERS', 4))
+RING_MIN_ELEMS = int(os.environ.get('APP_RING_MIN_ELEMS', 1 << 16))
+MAX_WORKER_ID = 255       # worker_id is 8 bits on the wire
+# A switch aggregates at most MAX_WORKERS workers per job, a root over leaf
+# switches (APP_NUM_LEAVES, see network.py) MAX_WORKERS per leaf
+NUM_LEAVES = int(os.environ.get('APP_NUM_LEAVES', 0))
+SWITCH_MAX_WORKERS = min(MAX_WORKER_ID, max(NUM_LEAVES, 1) * MAX_WORKERS)
+
+def get_host_id(rank):
+    """Index of the host running worker `rank` of this job, see network.py"""
+    return JOB_ID * NUM_WORKERS + rank
+
 def get_worker_mac(rank):
     """Get MAC address for worker"""
-    return f"00:00:00:00:01:{rank+1:02x}"
+    return f"00:00:00:00:01:{get_host_id(rank)+1:02x}"
 
 def get_worker_ip(rank):
     """Get IP address for worker"""
-    return f"10.0.0.{rank+1}"
-
-def ip_to_int(ip_str):
-    """Convert IP string to 32-bit integer"""
-    parts = ip_str.split('.')
-    return (int(parts[0]) << 24) + (int(parts[1]) << 16) + (int(parts[2]) << 8) + int(parts[3])
+    return f"10.0.0.{get_host_id(rank)+1}"
 
-def mac_to_bytes(mac_str):
-    """Convert MAC string to 6 bytes"""
-    return bytes.fromhex(mac_str.replace(':', ''))
+def get_worker_port(rank):
+    """Get UDP port on which the worker receives results"""
+    return 10000 + get_host_id(rank)
 
-def calculate_checksum(data):
-    """Calculate IP checksum"""
-    if len(data) % 2 == 1:
-        data += b'\x00'
+def get_ring_addr(rank):
+    """Get address and TCP port on which the worker accepts its ring predecessor"""
+    host = SWITCH_MODEL.rpartition(':')[0] if SWITCH_MODEL else get_worker_ip(rank)
+    return host, 20000 + get_host_id(rank)
 
-    checksum = 0
-    for i in range(0, len(data), 2):
-        word = (data[i] << 8) + data[i + 1]
-        checksum += word
-        checksum = (checksum & 0xFFFF) + (checksum >> 16)
+def get_test_id(i, kind="iter"):
+    """Test id of iteration `i`, jobs other than the first get their own"""
+    return "udp-%s-%d" % (kind, i) if JOB_ID == 0 else "udp-job-%d-%s-%d" % (JOB_ID, kind, i)
 
-    return (~checksum) & 0xFFFF
-
-def pack_switchml_packet(worker_id, chunk_id, num_workers, flags, values):
+class Collective:
     """
-    Pack SwitchML data into bytes for UDP transmission
-    Format: worker_id(1) + chunk_id(1) + num_workers(1) + flags(1) + value0(4) + value1(4) + value2(4) + value3(4)
+    One AllReduce call on a SwitchMLEndpoint
+
+    This is the awaitable handle returned by SwitchMLEndpoint.allreduce().
+    Awaiting it yields True once the aggregated vector has been copied to
+    `result`, or False if some chunk ran out of retries. Chunks whose sums
+    wrapped around at the switch are listed in `overflowed`. In jobs with a
+    quorum or deadline, `partial` maps chunks released without some workers
+    to the bitmap of the ranks they contain. Chunks in `missed` came back
+    after the switch had reused their slot: they hold this worker's own
+    values, and `partial` maps them to its own rank
     """
-    # Ensure we have exactly 4 values, pad with zeros if necessary
-    padded_values = values + [0] * (4 - len(values))
-    padded_values = padded_values[:4]  # Truncate if more than 4
-
-    # Pack using network byte order (big-endian)
-    packet = struct.pack('!BBBBLLLL',
-                        worker_id, chunk_id, num_workers, flags,
-                        padded_values[0], padded_values[1],
-                        padded_values[2], padded_values[3])
-    return packet
-
-def unpack_switchml_packet(data):
+
+    def __init__(self, endpoint, data, result, window, seq_base, signed=False):
+        self.result = result
+        self.num_workers = endpoint.num_workers
+        self.window = max(1, min(window, MAX_WINDOW))
+        self.seq_base = seq_base
+
+        # Encode the whole vector up front, results are decoded into the codec
+        self.codec = VectorCodec(data)
+        self.codec.set_headers(endpoint.rank, seq_base, endpoint.num_workers,
+                               flags=FLAG_SIGNED if signed else 0, job_id=JOB_ID)
+        self.num_chunks = self.codec.num_chunks
+
+        self.attempts = [0] * self.num_chunks
+        self.first_sent = [0.0] * self.num_chunks
+        self.latency = [0.0] * self.num_chunks   # first send to result, in seconds
+        self.completed = [False] * self.num_chunks
+        self.overflowed = []
+        self.partial = {}
+        self.missed = []
+        self.base = 0           # lowest chunk without a result
+        self.next_chunk = 0     # next chunk to be sent for the first time
+        self.future = endpoint.loop.create_future()
+
+    def __await__(self):
+        return self.future.__await__()
+
+    def done(self):
+        return self.future.done()
+
+    def complete(self, chunk):
+        """ Record the result of `chunk`. Returns True once every chunk completed """
+        self.completed[chunk] = True
+        while self.base < self.num_chunks and self.completed[self.base]:
+            self.base += 1
+        return self.base == self.num_chunks
+
+    def contributors(self):
+        """ The bitmap of the ranks in the sum of every value, see contributors() """
+        bitmaps = np.full(self.num_chunks, (1 << self.num_workers) - 1, dtype=np.uint64)
+        for chunk, bitmap in self.partial.items():
+            bitmaps[chunk] = bitmap
+        return np.repeat(bitmaps, self.codec.chunk_size)[:self.codec.num_elems]
+
+    def finish(self, success):
+        if success:
+            self.codec.copy_to(self.result)
+        if not self.future.done():
+            self.future.set_result(success)
+
+class SwitchMLEndpoint:
     """
-    Unpack SwitchML packet from bytes
-    Returns: (worker_id, chunk_id, num_workers, flags, [value0, value1, value2, value3])
+    A worker's connection to the switch, shared by all of its collectives
+
+    Chunks are sent through a raw socket and results arrive on the worker's
+    UDP port. The event loop wakes the endpoint when that socket is readable,
+    and it drains all pending results into a RecvRing and dispatches them to
+    their collective by chunk_id, without allocating per datagram.
+    Each collective keeps up to its own `window` chunks in flight, and all
+    collectives together keep at most MAX_WINDOW, since chunk k may only be
+    sent once chunk k - MAX_WINDOW, the previous user of its slot, has
+    completed (see p4/main.p4).
+
+    Collectives are numbered in the order allreduce() is called, so every
+    worker must start its collectives in the same order
     """
-    if len(data) < 20:  # 4 bytes header + 4*4 bytes values
-        return None
 
-    # Unpack using network byte order (big-endian)
-    unpacked = struct.unpack('!BBBBLLLL', data[:20])
-    worker_id, chunk_id, num_workers, flags = unpacked[:4]
-    values = list(unpacked[4:])
-
-    return (worker_id, chunk_id, num_workers, flags, values)
-
-def create_raw_udp_packet(src_ip, dst_ip, src_port, dst_port, payload, src_mac, dst_mac):
-    """Create a complete Ethernet/IP/UDP packet"""
-
-    # Ethernet header (14 bytes)
-    eth_header = struct.pack('!6s6sH',
-                            mac_to_bytes(dst_mac),    # Destination MAC
-                            mac_to_bytes(src_mac),    # Source MAC
-                            0x0800)                   # EtherType (IPv4)
-
-    # IP header (20 bytes)
-    version_ihl = 0x45  # Version 4, Header Length 5 (20 bytes)
-    tos = 0
-    total_length = 20 + 8 + len(payload)  # IP header + UDP header + payload
-    identification = random.randint(0, 65535)
-    flags_fragment = 0x4000  # Don't fragment
-    ttl = 64
-    protocol = 17  # UDP
-    checksum = 0  # Will calculate later
-    src_ip_int = ip_to_int(src_ip)
-    dst_ip_int = ip_to_int(dst_ip)
-
-    # Pack IP header without checksum
-    ip_header_no_checksum = struct.pack('!BBHHHBBHLL',
-                                       version_ihl, tos, total_length,
-                                       identification, flags_fragment,
-                                       ttl, protocol, 0,
-                                       src_ip_int, dst_ip_int)
-
-    # Calculate and insert checksum
-    ip_checksum = calculate_checksum(ip_header_no_checksum)
-    ip_header = struct.pack('!BBHHHBBHLL',
-                           version_ihl, tos, total_length,
-                           identification, flags_fragment,
-                           ttl, protocol, ip_checksum,
-                           src_ip_int, dst_ip_int)
-
-    # UDP header (8 bytes)
-    udp_length = 8 + len(payload)
-    udp_checksum = 0  # Optional for IPv4, we'll set to 0
-    udp_header = struct.pack('!HHHH',
-                            src_port, dst_port,
-                            udp_length, udp_checksum)
-
-    # Complete packet
-    packet = eth_header + ip_header + udp_header + payload
-    return packet
-
-def AllReduce(rank, data, result):
+    def __init__(self, rank, send_sock, recv_sock, loop, num_workers=NUM_WORKERS):
+        self.rank = rank
+        self.num_workers = num_workers  # Informational, the switch knows the group size
+        self.loop = loop
+        self.send_sock = send_sock
+        self.recv_sock = recv_sock
+        # Slots fit the largest results, partial ones carry a bitmap
+        self.ring = RecvRing(RECV_BATCH, payload_size(CHUNK_SIZE) + CONTRIB.size)
+
+        # Headers only depend on the flow, build them once
+        frame = FrameTemplate(get_worker_mac(rank), SWITCH_MAC, get_worker_ip(rank), SWITCH_IP,
+                              get_worker_port(rank), SWITCHML_PORT, payload_size(CHUNK_SIZE))
+        self.impairment = Impairment.from_spec(IMPAIR, get_host_id(rank)) if IMPAIR else None
+        if self.impairment is None:
+            self.sender = BatchSender(send_sock, frame)
+        else:
+            self.sender = ImpairedSender(send_sock, frame, self.impairment)
+            Log("Worker %d: Impairing sent packets with %s", rank, IMPAIR)
+        self.packets_sent = 0    # including retransmissions
+        self.bytes_sent = 0      # SwitchML payload bytes of those packets
+
+        self.collectives = []    # unfinished collectives, oldest first
+        self.pending = {}        # wire chunk_id -> (collective, chunk)
+        self.timers = TimerHeap()  # wire chunk_id -> retransmission deadline
+        self.rtt = RttEstimator(INITIAL_RTO, MIN_RTO, MAX_RTO)
+        self.timer_handle = None
+        self.timer_deadline = None
+        self.released = None     # future of rendezvous()
+        loop.add_reader(recv_sock, self._on_readable)
+
+    async def rendezvous(self, timeout=JOIN_TIMEOUT):
+        """
+        Join the rendezvous of the worker's job at the switch, which releases
+        all workers of the job at once when the last one joined, and wait for
+        the release. Returns False if it did not come within `timeout` seconds.
+        Joining again in the same run returns as soon as the switch answers
+        """
+        self.released = self.loop.create_future()
+        payload = join_payload(self.rank, self.num_workers, JOB_ID, _run_nonce)
+        deadline = self.loop.time() + timeout
+        while True:
+            sent, error = self.sender.send_batch([payload])
+            if error is not None:
+                LogError("Worker %d: ERROR - Failed to send join: %s", self.rank, error)
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(asyncio.shield(self.released), min(JOIN_RETRY, remaining))
+                return True
+            except asyncio.TimeoutError:
+                continue
+
+    def allreduce(self, data, result, window=WINDOW_SIZE, signed=False):
+        """
+        Start an AllReduce of `data` into `result` and return its awaitable
+        handle right away. With `signed`, the switch checks the sums for
+        overflow as two's complement values rather than as unsigned ones
+        """
+        global _next_chunk_seq
+
+        # Chunk numbering continues across calls so that every AllReduce
+        # walks forward through the switch's register slots, see MAX_WINDOW
+        collective = Collective(self, data, result, window, _next_chunk_seq, signed)
+        _next_chunk_seq += collective.num_chunks
+        Log("Worker %d: Starting AllReduce on %d elements (window %d)", self.rank, len(data), collective.window)
+
+        if collective.num_chunks == 0:
+            collective.finish(True)
+        else:
+            self.collectives.append(collective)
+            self._pump()
+        return collective
+
+    def close(self):
+        """ Fail all unfinished collectives and release the sockets """
+        for collective in self.collectives:
+            collective.finish(False)
+        self.collectives = []
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+        self.loop.remove_reader(self.recv_sock)
+        self.recv_sock.close()
+        self.send_sock.close()
+
+    def _pump(self):
+        """ Send every chunk the per-call windows and the switch's slot pool allow """
+        oldest = self.collectives[0] if self.collectives else None
+        limit = oldest.seq_base + oldest.base + MAX_WINDOW if oldest else 0
+
+        burst = []
+        for collective in self.collectives:
+            while (collective.next_chunk < collective.num_chunks and
+                   collective.next_chunk < collective.base + collective.window and
+                   collective.seq_base + collective.next_chunk < limit):
+                burst.append((collective, collective.next_chunk))
+                collective.next_chunk += 1
+            if collective.seq_base + collective.next_chunk >= limit:
+                break
+
+        if burst:
+            self._send(burst)
+        self._arm_timer()
+
+    def _send(self, burst):
+        """ (Re)transmit `burst` of (collective, chunk) and (re)arm their timers """
+        payloads = [c.codec.payload(chunk) for c, chunk in burst]
+        sent, error = self.sender.send_batch(payloads)
+        self.packets_sent += sent
+        self.bytes_sent += sum(p.nbytes for p in payloads[:sent])
+        now = self.loop.time()
+        for i, (collective, chunk) in enumerate(burst):
+            wire_id = (collective.seq_base + chunk) % CHUNK_ID_SPACE
+            self.pending[wire_id] = (collective, chunk)
+            collective.attempts[chunk] += 1
+            if collective.attempts[chunk] == 1:
+                collective.first_sent[chunk] = now
+            # Chunks that failed to send are due again right away, like a lost packet
+            timeout = self.rtt.timeout(collective.attempts[chunk]) if i < sent else 0
+            self.timers.schedule(wire_id, now + timeout)
+        if error is not None:
+            LogError("Worker %d: ERROR - Failed to send packet: %s", self.rank, error)
+        LogDebug("Worker %d: Sent %d chunks", self.rank, sent)
+
+    def _arm_timer(self):
+        """ Make sure the loop wakes up for the earliest retransmission deadline """
+        deadline = self.timers.next_deadline()
+        if deadline is None or (self.timer_deadline is not None and self.timer_deadline <= deadline):
+            # A timer that fires early just finds nothing expired and re-arms
+            return
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+        self.timer_deadline = deadline
+        self.timer_handle = self.loop.call_at(deadline, self._on_timer)
+
+    def _on_timer(self):
+        """ Retransmit whatever timed out """
+        self.timer_handle = None
+        self.timer_deadline = None
+
+        burst = []
+        for wire_id in self.timers.expired(self.loop.time()):
+            # A collective failed earlier in this loop took its timers along
+            owner = self.pending.get(wire_id)
+            if owner is None:
+                continue
+            collective, chunk = owner
+            if collective.done():
+                continue
+            if collective.attempts[chunk] >= MAX_RETRIES:
+                LogError("Worker %d: ERROR - Max retries reached for chunk %d", self.rank, chunk)
+                self._fail(collective)
+                continue
+            LogDebug("Worker %d: Timeout for chunk %d, retrying (rto %.1fms)...", self.rank, chunk, self.rtt.rto * 1000)
+            burst.append((collective, chunk))
+
+        if burst:
+            self._send(burst)
+        self._pump()
+
+    def _fail(self, collective):
+        for wire_id, (owner, chunk) in list(self.pending.items()):
+            if owner is collective:
+                del self.pending[wire_id]
+                self.timers.cancel(wire_id)
+        self.collectives.remove(collective)
+        collective.finish(False)
+
+    def _on_readable(self):
+        """
+        Handle up to RECV_BATCH results waiting on the receive socket, the loop
+        calls again while more are pending
+        """
+        ring = self.ring
+        received = ring.drain(self.recv_sock)
+        for i in range(received):
+            self.datagram_received(ring.packet(i))
+        if ring.error is not None:
+            LogError("Worker %d: ERROR - Exception receiving response: %s", self.rank, ring.error)
+
+    def datagram_received(self, data):
+        """ Handle result payload `data`, a view that is only valid during the call """
+        # Unpack response
+        response = unpack_header(data)
+        if response is None:
+            LogError("Worker %d: ERROR - Invalid response packet", self.rank)
+            return
+
+        resp_worker_id, resp_chunk_id, resp_num_workers, resp_flags, resp_count = response
+
+        # The switch released the job
+        if resp_flags & FLAG_JOIN:
+            if resp_flags & FLAG_RESULT and self.released is not None and not self.released.done():
+                self.released.set_result(True)
+            return
+
+        # Verify this is a response we're expecting
+        owner = self.pending.get(resp_chunk_id)
+        if owner is None or not resp_flags & FLAG_RESULT:
+            LogDebug("Worker %d: Ignoring response: chunk_id=%d, flags=%d", self.rank, resp_chunk_id, resp_flags)
+            return
+
+        # Decode result values into the output vector
+        collective, chunk = owner
+        if not collective.codec.answers(chunk, data):
+            LogDebug("Worker %d: Ignoring result of another use of chunk_id %d", self.rank, resp_chunk_id)
+            return
+        if not collective.codec.store(chunk, data):
+            LogError("Worker %d: ERROR - Truncated response for chunk %d (%d values)", self.rank, chunk, resp_count)
+            return
+        LogDebug("Worker %d: Received valid response for chunk %d", self.rank, chunk)
+
+        del self.pending[resp_chunk_id]
+        self.timers.cancel(resp_chunk_id)
+        if resp_flags & FLAG_OVERFLOW:
+            collective.overflowed.append(chunk)
+        bitmap = contributors(data)
+        if bitmap == 0:
+            # The switch echoed this worker's values, it has no sum anymore
+            collective.missed.append(chunk)
+            bitmap = 1 << self.rank
+        if bitmap is not None:
+            collective.partial[chunk] = bitmap
+        collective.latency[chunk] = self.loop.time() - collective.first_sent[chunk]
+        if collective.attempts[chunk] == 1:
+            self.rtt.sample(collective.latency[chunk])
+        if collective.complete(chunk):
+            self.collectives.remove(collective)
+            collective.finish(True)
+            Log("Worker %d: AllReduce completed successfully", self.rank)
+        self._pump()
+
+async def open_endpoint(rank):
     """
-    Perform in-network all-reduce over UDP using raw sockets with reliability
-
-    :param int   rank: the worker's rank
-    :param [int] data: the input vector for this worker
-    :param [int] result: the output vector
-
-    This function is blocking, i.e. only returns with a result or error
+    Create the sockets of worker `rank` and attach a SwitchMLEndpoint to the
+    running event loop. Raises OSError if a socket cannot be created
     """
-    Log(f"Worker {rank}: Starting AllReduce on {len(data)} elements")
-
-    # Get network information
-    src_mac = get_worker_mac(rank)
-    src_ip = get_worker_ip(rank)
-    # Try unicast to switch first to debug
-    dst_mac = "00:00:00:00:01:00"  # Switch MAC
-    dst_ip = "10.0.0.100"           # Switch IP
-    # dst_mac = "ff:ff:ff:ff:ff:ff"  # Broadcast MAC
-    # dst_ip = "255.255.255.255"     # Broadcast IP
-    src_port = 10000 + rank
-    dst_port = SWITCHML_PORT
-
-    Log(f"Worker {rank}: Using {src_ip}:{src_port} -> {dst_ip}:{dst_port}")
-    Log(f"Worker {rank}: MAC {src_mac} -> {dst_mac}")
+    loop = asyncio.get_running_loop()
 
     # Determine interface name - in Mininet it's just eth0 inside each host
     interface = "eth0"
 
-    # Create raw socket for sending
-    try:
+    # Create raw socket for sending, or a UDP socket that carries the same
+    # frames to the switch model
+    if SWITCH_MODEL:
+        send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    else:
         send_sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(0x0003))
-        send_sock.bind((interface, 0))
-        Log(f"Worker {rank}: Created raw send socket on {interface}")
-    except Exception as e:
-        Log(f"Worker {rank}: ERROR - Could not create raw socket: {e}")
-        Log(f"Worker {rank}: Make sure interface {interface} exists")
-        return False
-
-    # Create UDP socket for receiving
     try:
+        if SWITCH_MODEL:
+            host, port = SWITCH_MODEL.rsplit(':', 1)
+            send_sock.connect((host, int(port)))
+            interface = SWITCH_MODEL
+        else:
+            send_sock.bind((interface, 0))
+        send_sock.setblocking(False)
+        Log("Worker %d: Created send socket on %s", rank, interface)
+
+        # Create UDP socket for receiving, read by the event loop
+        src_port = get_worker_port(rank)
         recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         recv_sock.bind(('', src_port))  # Bind to any address on our port
-        # Set non-blocking for use with unreliable_receive
         recv_sock.setblocking(False)
-        Log(f"Worker {rank}: Created UDP receive socket on port {src_port}")
-    except Exception as e:
-        Log(f"Worker {rank}: ERROR - Could not create receive socket: {e}")
+        Log("Worker %d: Created UDP receive socket on port %d", rank, src_port)
+    except OSError:
         send_sock.close()
-        return False
+        raise
+
+    endpoint = SwitchMLEndpoint(rank, send_sock, recv_sock, loop)
+    Log("Worker %d: Using %s:%d -> %s:%d", rank, get_worker_ip(rank), src_port, SWITCH_IP, SWITCHML_PORT)
 
+    # Start together with the other workers: once they all joined at the
+    # switch, and before that at the barrier if they were launched behind one
     try:
-        num_workers = 3  # This should match NUM_WORKERS in network.py
-        result_idx = 0
-
-        # Add initial delay to let all workers start
-        time.sleep(0.5)  # Give all workers time to start
-
-        # Process data in chunks
-        for chunk_start in range(0, len(data), CHUNK_SIZE):
-            chunk_id = chunk_start // CHUNK_SIZE
-            chunk_data = data[chunk_start:chunk_start + CHUNK_SIZE]
-
-            # Pad chunk to exactly CHUNK_SIZE elements
-            while len(chunk_data) < CHUNK_SIZE:
-                chunk_data.append(0)
-
-            Log(f"Worker {rank}: Processing chunk {chunk_id} with values {chunk_data[:len(data[chunk_start:chunk_start + CHUNK_SIZE])]}")
-
-            # Try to send and receive with retransmission
-            retry_count = 0
-            success = False
-
-            while retry_count < MAX_RETRIES and not success:
-                # Create SwitchML payload
-                switchml_payload = pack_switchml_packet(
-                    worker_id=rank,
-                    chunk_id=chunk_id,
-                    num_workers=num_workers,
-                    flags=0,  # Data packet
-                    values=chunk_data
-                )
-
-                # Create raw packet
-                raw_packet = create_raw_udp_packet(
-                    src_ip, dst_ip, src_port, dst_port,
-                    switchml_payload, src_mac, dst_mac
-                )
-
-                # Send packet using unreliable_send
-                Log(f"Worker {rank}: Sending chunk {chunk_id} (attempt {retry_count + 1})")
-                try:
-                    # Send packet directly for now
-                    bytes_sent = send_sock.send(raw_packet)
-                    Log(f"Worker {rank}: Sent chunk {chunk_id} (attempt {retry_count + 1}, {bytes_sent} bytes)")
-                except Exception as e:
-                    Log(f"Worker {rank}: ERROR - Failed to send packet: {e}")
-                    retry_count += 1
-                    continue
-
-                # Wait for response with timeout
-                start_time = time.time()
-
-                while time.time() - start_time < TIMEOUT:
-                    try:
-                        # Try to receive response
-                        response_data, addr = recv_sock.recvfrom(1024)
-
-                        Log(f"Worker {rank}: Received response from {addr}")
-
-                        # Unpack response
-                        response = unpack_switchml_packet(response_data)
-                        if response is None:
-                            Log(f"Worker {rank}: ERROR - Invalid response packet")
-                            continue
-
-                        resp_worker_id, resp_chunk_id, resp_num_workers, resp_flags, chunk_result = response
-
-                        # Verify this is the response we're expecting
-                        if resp_chunk_id == chunk_id and resp_flags == 1:
-                            Log(f"Worker {rank}: Received valid response for chunk {chunk_id}: {chunk_result}")
-
-                            # Copy result values to output
-                            remaining_elements = len(data) - chunk_start
-                            elements_to_copy = min(CHUNK_SIZE, remaining_elements)
-
-                            for i in range(elements_to_copy):
-                                if result_idx < len(result):
-                                    result[result_idx] = chunk_result[i]
-                                    result_idx += 1
-
-                            success = True
-                            break
-                        else:
-                            Log(f"Worker {rank}: Ignoring response: chunk_id={resp_chunk_id}, flags={resp_flags}")
-
-                    except socket.error:
-                        # No data available, continue waiting
-                        time.sleep(0.01)
-                    except Exception as e:
-                        Log(f"Worker {rank}: ERROR - Exception receiving response: {e}")
-                        break
-
-                if not success:
-                    retry_count += 1
-                    if retry_count < MAX_RETRIES:
-                        Log(f"Worker {rank}: Timeout for chunk {chunk_id}, retrying...")
-                    else:
-                        Log(f"Worker {rank}: ERROR - Max retries reached for chunk {chunk_id}")
-                        return False
-
-            # Add small delay between chunks
-            time.sleep(0.05)
-
-        Log(f"Worker {rank}: AllReduce completed successfully")
+        launched = await launch.barrier(get_host_id(rank))
+    except OSError:
+        endpoint.close()
+        raise
+    if RENDEZVOUS:
+        start = loop.time()
+        if await endpoint.rendezvous():
+            Log("Worker %d: Released by the switch after %.1fms", rank, (loop.time() - start) * 1e3)
+        else:
+            LogWarning("Worker %d: Not released by the switch, starting anyway", rank)
+    elif not launched:
+        await asyncio.sleep(STARTUP_DELAY)
+    return endpoint
+
+def _accept(rank, num_workers, bitmaps, contrib):
+    # Hand the contributors of every sum to the caller's `contrib`, or
+    # reject sums missing some worker if the caller did not ask for them
+    if contrib is not None:
+        contrib[:len(bitmaps)] = bitmaps if isinstance(contrib, np.ndarray) else bitmaps.tolist()
         return True
+    missing = np.count_nonzero(bitmaps != (1 << num_workers) - 1)
+    if missing:
+        LogWarning("Worker %d: %d sums are missing workers", rank, missing)
+        return False
+    return True
+
+async def _first_pass(endpoint, data, result, window):
+    # A pass whose sums the workers build on, e.g. to agree on a scale. All
+    # workers get the same partial sums, except a straggler that missed some
+    collective = endpoint.allreduce(data, result, window)
+    if not await collective:
+        return None
+    if collective.missed:
+        LogWarning("Worker %d: Missed %d chunks of the first pass", endpoint.rank, len(collective.missed))
+        return None
+    return collective
+
+def rescale(values, contrib, num_workers=NUM_WORKERS):
+    """
+    Estimates of the complete sums from partial ones: every value is scaled
+    by `num_workers` over the number of ranks in its bitmap in `contrib`
+    (see allreduce()). Returns a float64 array; the sums of signed values
+    must be passed as signed integers
+    """
+    bitmaps = np.asarray(contrib, dtype='>u8')
+    counts = np.unpackbits(bitmaps.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+    return np.asarray(values, dtype=np.float64) * num_workers / np.maximum(counts, 1)
+
+async def allreduce(endpoint, data, result, window=WINDOW_SIZE, contrib=None):
+    """
+    Perform in-network all-reduce over UDP on `endpoint` without blocking the
+    event loop
+
+    :param SwitchMLEndpoint endpoint: the worker's endpoint, see open_endpoint()
+    :param [int] data: the input vector for this worker
+    :param [int] result: the output vector
+    :param int   window: the number of chunks allowed in flight at once
+    :param contrib: optional output array of one bitmap of ranks per value,
+                    to accept sums released without some workers
+
+    Up to `window` chunks are outstanding at the switch. Each outstanding chunk
+    has its own retransmission timer and retry budget, and results are accepted
+    in any order. Several calls may run concurrently on the same endpoint,
+    e.g. with asyncio.gather(), as long as every worker starts them in the
+    same order. Returns True on success, and False if a chunk ran out of
+    retries or its sums overflowed 32 bits at the switch
+
+    In jobs with APP_QUORUM or APP_DEADLINE_US, the switch may release sums
+    without some workers. Those fail the call, unless `contrib` is given:
+    then result[i] is the sum of the values of the ranks in contrib[i] (bit
+    r for rank r), which rescale() turns into estimates of the full sums. A
+    straggler whose chunk was released and its slot reused since only has
+    its own values, and its own bit
+    """
+    collective = endpoint.allreduce(data, result, window)
+    if not await collective:
+        return False
+    if collective.overflowed:
+        LogWarning("Worker %d: %d chunks overflowed", endpoint.rank, len(collective.overflowed))
+        return False
+    return _accept(endpoint.rank, endpoint.num_workers, collective.contributors(), contrib)
+
+async def allreduce_float(endpoint, data, result, window=WINDOW_SIZE, exchange=True, bound=None, contrib=None):
+    """
+    Perform in-network all-reduce of floating point values on `endpoint`
+
+    :param SwitchMLEndpoint endpoint: the worker's endpoint, see open_endpoint()
+    :param [float] data: the input vector for this worker (list or NumPy array)
+    :param [float] result: the output vector
+    :param int     window: the number of chunks allowed in flight at once
+    :param bool    exchange: agree on the scale of every block first
+    :param bound:  optional output array for the largest absolute error of
+                   every sum (BlockQuantizer.error_bound() of its scale)
+    :param contrib: optional output array of one bitmap of ranks per value,
+                    to accept partial sums, see allreduce()
+
+    The values are reduced as block-scaled fixed-point integers (see
+    lib/quant.py). With `exchange`, a first AllReduce with one word per
+    block agrees on the scale of every block, a second one sums the scaled
+    values. Without it, a single AllReduce uses a fixed scale, and the
+    chunks the switch reports as overflowed are sent again at a reduced
+    scale. Returns True on success
+
+    The error is absolute: small values sharing a block with values orders
+    of magnitude larger keep few significant bits. A worker the exponent
+    pass went on without fails the call, since it cannot know the scale
+    """
+    quant = BlockQuantizer(endpoint.num_workers)
+    if exchange:
+        bounds = np.zeros(quant.num_blocks(len(data)), dtype=np.uint32)
+        if not await _first_pass(endpoint, quant.bounds(data), bounds, window):
+            return False
+        # Bounds without some workers leave their values no headroom, the
+        # switch flags the chunks they overflow
+        shift = quant.shifts(bounds)
+    else:
+        shift = quant.fixed_shift()
+
+    sums = np.zeros(len(data), dtype=np.uint32)
+    collective = endpoint.allreduce(quant.encode(data, shift), sums, window, signed=True)
+    if not await collective:
+        return False
+    values = quant.decode(sums, shift)
+    errors = quant.value_bounds(shift, len(data))
+    bitmaps = collective.contributors()
+
+    if collective.overflowed:
+        # Every worker sees the same flags, and so sends the same chunks again
+        chunks = np.array(sorted(collective.overflowed))
+        index = (chunks[:, None] * CHUNK_SIZE + np.arange(CHUNK_SIZE)).reshape(-1)
+        index = index[index < len(data)]
+        LogDebug("Worker %d: Resending %d overflowed chunks", endpoint.rank, len(chunks))
+
+        safe = quant.fixed_shift(safe=True)
+        sums = np.zeros(len(index), dtype=np.uint32)
+        resend = np.asarray(data, dtype=np.float64)[index]
+        collective = endpoint.allreduce(quant.encode(resend, safe), sums, window, signed=True)
+        if not await collective or collective.overflowed:
+            return False
+        values[index] = quant.decode(sums, safe)
+        errors[index] = quant.error_bound(safe)
+        bitmaps[index] = collective.contributors()
+
+    result[:len(data)] = values if isinstance(result, np.ndarray) else values.tolist()
+    if bound is not None:
+        bound[:len(data)] = errors if isinstance(bound, np.ndarray) else errors.tolist()
+    return _accept(endpoint.rank, endpoint.num_workers, bitmaps, contrib)
+
+async def allreduce_sparse(endpoint, data, result, window=WINDOW_SIZE, floats=False, contrib=None):
+    """
+    Perform in-network all-reduce of a mostly zero vector on `endpoint`
+
+    :param SwitchMLEndpoint endpoint: the worker's endpoint, see open_endpoint()
+    :param data: the input vector for this worker (list or NumPy array)
+    :param result: the output vector
+    :param int window: the number of chunks allowed in flight at once
+    :param bool floats: reduce floating point values, see allreduce_float()
+    :param contrib: optional output array of one bitmap of ranks per value,
+                    to accept partial sums, see allreduce()
+
+    Only blocks of CHUNK_SIZE values that are non-zero on some worker are
+    sent (see lib/sparse.py): a first AllReduce of presence counters finds
+    them, a second one sums them. Returns True on success. A worker the
+    presence pass went on without fails the call, since it cannot know the
+    blocks the others send
+    """
+    n = len(data)
+    words = np.zeros(sparse.num_blocks(sparse.num_blocks(n, CHUNK_SIZE), sparse.BLOCKS_PER_WORD),
+                     dtype=np.uint32)
+    presence = await _first_pass(endpoint, sparse.presence(data, CHUNK_SIZE), words, window)
+    if not presence:
+        return False
+    blocks = sparse.union(words, n, CHUNK_SIZE)
+    LogDebug("Worker %d: %d of %d blocks are non-zero", endpoint.rank, len(blocks), sparse.num_blocks(n, CHUNK_SIZE))
+
+    values = sparse.gather(data, blocks, CHUNK_SIZE)
+    packed = np.zeros(len(values), dtype=np.uint64)
+    if floats:
+        sums = np.zeros(len(values))
+        ok = await allreduce_float(endpoint, values, sums, window, contrib=packed)
+    else:
+        sums = np.zeros(len(values), dtype=np.uint32)
+        ok = await allreduce(endpoint, values, sums, window, contrib=packed)
+    if not ok:
+        return False
+
+    # Blocks outside the union are zero on every worker of the presence pass
+    bitmaps = np.repeat(presence.contributors()[np.arange(sparse.num_blocks(n, CHUNK_SIZE)) // sparse.BLOCKS_PER_WORD],
+                        CHUNK_SIZE)[:n]
+    index = sparse.gather(np.arange(1, n + 1), blocks, CHUNK_SIZE) - 1   # -1 for padding
+    bitmaps[index[index >= 0]] = packed[index >= 0]
+
+    values = sparse.scatter(sums, blocks, n, CHUNK_SIZE, dtype=sums.dtype)
+    result[:n] = values if isinstance(result, np.ndarray) else values.tolist()
+    return _accept(endpoint.rank, endpoint.num_workers, bitmaps, contrib)
+
+def select_transport(num_elems, num_workers=NUM_WORKERS):
+    """
+    "switch" or "ring" for an AllReduce of `num_elems` values among
+    `num_workers` workers. The same on every worker of the job
+    """
+    if TRANSPORT in ("switch", "ring"):
+        return TRANSPORT
+    if num_workers > SWITCH_MAX_WORKERS:
+        return "ring"
+    if num_workers <= RING_MAX_WORKERS and num_elems >= RING_MIN_ELEMS:
+        return "ring"
+    return "switch"
+
+async def open_ring(rank):
+    """
+    Connect worker `rank` to its neighbours in the host ring of its job.
+    Raises OSError or asyncio.TimeoutError if they do not show up
+    """
+    addrs = [get_ring_addr(r) for r in range(NUM_WORKERS)]
+    await launch.barrier(get_host_id(rank))
+    ring = await Ring.open(rank, addrs)
+    Log("Worker %d: Joined ring of %d workers on %s:%d", rank, NUM_WORKERS, *addrs[rank])
+    return ring
 
+async def allreduce_ring(ring, data, result, signed=False):
+    """
+    Perform all-reduce over the host ring, without the switch
+
+    :param Ring  ring: the worker's ring, see open_ring()
+    :param [int] data: the input vector for this worker
+    :param [int] result: the output vector
+
+    Sums wrap around 32 bits like the switch's. Returns True on success, and
+    False if a neighbour went away or some sum overflowed
+    """
+    try:
+        sums, overflowed = await ring.allreduce(data, signed)
+    except (OSError, asyncio.IncompleteReadError) as e:
+        LogError("Worker %d: ERROR - Ring AllReduce failed: %s", ring.rank, e)
+        return False
+    result[:len(sums)] = sums if isinstance(result, np.ndarray) else sums.tolist()
+    if overflowed:
+        LogWarning("Worker %d: Ring sums overflowed", ring.rank)
+        return False
+    return True
+
+async def _ring_collective(rank, data, result):
+    # Run allreduce_ring() on a ring of its own
+    try:
+        ring = await open_ring(rank)
+    except (OSError, asyncio.TimeoutError) as e:
+        LogError("Worker %d: ERROR - Could not join the ring: %r", rank, e)
+        return False
+    try:
+        return await allreduce_ring(ring, data, result)
     finally:
-        send_sock.close()
-        recv_sock.close()
+        ring.close()
+
+def _run(rank, collective):
+    # Run `collective`(endpoint) on a private event loop and endpoint
+    async def run():
+        try:
+            endpoint = await open_endpoint(rank)
+        except OSError as e:
+            LogError("Worker %d: ERROR - Could not create sockets: %s", rank, e)
+            return False
+        try:
+            return await collective(endpoint)
+        finally:
+            endpoint.close()
+
+    return asyncio.run(run())
+
+def AllReduce(rank, data, result, window=WINDOW_SIZE, contrib=None):
+    """
+    Perform in-network all-reduce over UDP using raw sockets with reliability
+
+    :param int   rank: the worker's rank
+    :param [int] data: the input vector for this worker
+    :param [int] result: the output vector
+    :param int   window: the number of chunks allowed in flight at once
+    :param contrib: optional output array of one bitmap of ranks per value,
+                    to accept partial sums, see allreduce()
+
+    This function is blocking, i.e. only returns with a result or error.
+    It runs allreduce() on a private event loop, and returns False for sums
+    missing some worker unless `contrib` is given
+    """
+    return _run(rank, lambda endpoint: allreduce(endpoint, data, result, window, contrib))
+
+def AllReduceFloat(rank, data, result, window=WINDOW_SIZE, exchange=True, bound=None, contrib=None):
+    """
+    Perform in-network all-reduce of floating point values, see
+    allreduce_float(). This function is blocking
+    """
+    return _run(rank, lambda endpoint: allreduce_float(endpoint, data, result, window, exchange, bound, contrib))
+
+def AllReduceSparse(rank, data, result, window=WINDOW_SIZE, floats=False, contrib=None):
+    """
+    Perform in-network all-reduce of a mostly zero vector, see
+    allreduce_sparse(). This function is blocking
+    """
+    return _run(rank, lambda endpoint: allreduce_sparse(endpoint, data, result, window, floats, contrib))
+
+def AllReduceRing(rank, data, result):
+    """
+    Perform all-reduce over a ring of TCP connections between the workers,
+    see allreduce_ring(). This function is blocking
+    """
+    return asyncio.run(_ring_collective(rank, data, result))
+
+def AllReduceAuto(rank, data, result, window=WINDOW_SIZE):
+    """
+    Perform all-reduce over the transport select_transport() picks for the
+    vector and group size. An in-network AllReduce the switch stops
+    answering, e.g. for a job it has no slots for, is redone over the ring.
+    This function is blocking
+
+    Whether to fall back is decided by the whole group: after the vector,
+    the workers sum their failure flags at the switch, and all of them move
+    to the ring if any failed or got a partial vector, or the sum is missing
+    or partial. Every worker sees the same sum, so the ring never runs with
+    only part of the group
+    """
+    if select_transport(len(data)) == "ring":
+        return AllReduceRing(rank, data, result)
+
+    async def collective(endpoint):
+        handle = endpoint.allreduce(data, result, window)
+        failed = not await handle or bool(handle.partial) or bool(handle.missed)
+        failures = np.zeros(1, dtype=np.uint32)
+        flags = endpoint.allreduce([int(failed)], failures)
+        if await flags and not flags.partial and not failures[0]:
+            if handle.overflowed:
+                LogWarning("Worker %d: %d chunks overflowed", rank, len(handle.overflowed))
+                return False
+            return True
+        LogWarning("Worker %d: Switch did not answer all workers, falling back to the ring", rank)
+        return await _ring_collective(rank, data, result)
+
+    return _run(rank, collective)
 
 def main():
     rank = GetRankOrExit()
@@ -315,12 +813,24 @@ def main():
         num_elem = GenMultipleOfInRange(2, 32, 2 * CHUNK_SIZE) # Start with smaller vectors for testing
         data_out = GenInts(num_elem)  # Generate random integers
         data_in = [0] * num_elem  # Initialize result vector
-        CreateTestData("udp-iter-%d" % i, rank, data_out)
+        CreateTestData(get_test_id(i), rank, data_out)
         success = AllReduce(rank, data_out, data_in)
         if success:
-            RunIntTest("udp-iter-%d" % i, rank, data_in, True)
+            RunIntTest(get_test_id(i), rank, data_in, True)
+        else:
+            LogError("AllReduce failed!")
+            DumpLog()
+    for i in range(NUM_ITER):
+        num_elem = GenMultipleOfInRange(2, 2048, 2 * CHUNK_SIZE)
+        data_out = GenFloats(num_elem)
+        data_in = [0.0] * num_elem
+        bound = np.zeros(num_elem)
+        CreateTestData(get_test_id(i, "float"), rank, data_out)
+        if AllReduceFloat(rank, data_out, data_in, bound=bound):
+            RunFloatTest(get_test_id(i, "float"), rank, data_in, abs_tol=float(bound.max()))
         else:
-            Log("AllReduce failed!")
+            LogError("Float AllReduce failed!")
+            DumpLog()
     Log("Done")
 
 if __name__ == '__main__':
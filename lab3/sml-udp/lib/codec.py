@@ -0,0 +1,102 @@
+"""
+Copyright (c) 2025 Computer Networks Group @ UPB
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""
+    Whole-vector encoding/decoding of SwitchML payloads
+
+    A SwitchML payload is a 4 byte header (worker_id, chunk_id, num_workers,
+    flags) followed by CHUNK_SIZE 32-bit values, all in network byte order.
+    The header is exactly one 32-bit word, so a payload is (1 + CHUNK_SIZE)
+    big-endian words and a whole vector can be laid out as one 2D '>u4' array
+    with one row per chunk.
+"""
+
+import struct
+import numpy as np
+
+HEADER = struct.Struct('!BBBB')   # worker_id, chunk_id, num_workers, flags
+HEADER_SIZE = HEADER.size
+
+def payload_size(chunk_size):
+    """ Size in bytes of a SwitchML payload carrying `chunk_size` values """
+    return HEADER_SIZE + 4 * chunk_size
+
+def unpack_header(data):
+    """
+    Unpack the SwitchML header at the start of `data`
+    Returns: (worker_id, chunk_id, num_workers, flags) or None if `data` is too short
+    """
+    if len(data) < HEADER_SIZE:
+        return None
+    return HEADER.unpack_from(data)
+
+class VectorCodec:
+    """
+    Encodes an entire input vector into one preallocated buffer of SwitchML
+    payloads and decodes results straight into one preallocated output array
+
+    :param data: the input vector (list or NumPy array of integers)
+    :param int chunk_size: number of 32-bit values per payload
+    """
+
+    def __init__(self, data, chunk_size):
+        self.num_elems = len(data)
+        self.chunk_size = chunk_size
+        self.num_chunks = (self.num_elems + chunk_size - 1) // chunk_size
+        self.payload_size = payload_size(chunk_size)
+
+        # One row per chunk: header word followed by the values, zero padded
+        self.frames = np.zeros((self.num_chunks, 1 + chunk_size), dtype='>u4')
+        data = np.asarray(data, dtype=np.int64)
+        full = self.num_elems // chunk_size
+        self.frames[:full, 1:] = data[:full * chunk_size].reshape(full, chunk_size)
+        if full < self.num_chunks:
+            self.frames[full, 1:1 + self.num_elems - full * chunk_size] = data[full * chunk_size:]
+        self.payloads = memoryview(self.frames.reshape(-1).view(np.uint8))
+
+        self.result = np.zeros(self.num_elems, dtype=np.uint32)
+
+    def set_headers(self, worker_id, first_chunk_id, num_workers, flags=0):
+        """
+        Write the header word of every payload. Chunks are numbered consecutively
+        from `first_chunk_id`, wrapping around the 8-bit chunk_id
+        """
+        chunk_ids = (first_chunk_id + np.arange(self.num_chunks, dtype=np.uint32)) & 0xff
+        self.frames[:, 0] = ((worker_id & 0xff) << 24) | (chunk_ids << 16) | \
+                            ((num_workers & 0xff) << 8) | (flags & 0xff)
+
+    def payload(self, chunk):
+        """ The encoded payload of `chunk`, as a zero-copy memoryview """
+        start = chunk * self.payload_size
+        return self.payloads[start:start + self.payload_size]
+
+    def store(self, chunk, data):
+        """ Decode the values of result payload `data` into the slice of `chunk` """
+        start = chunk * self.chunk_size
+        count = min(self.chunk_size, self.num_elems - start)
+        self.result[start:start + count] = np.frombuffer(data, dtype='>u4', count=count, offset=HEADER_SIZE)
+
+    def copy_to(self, result):
+        """ Copy the decoded vector into the caller's output list or array """
+        if isinstance(result, np.ndarray):
+            result[:self.num_elems] = self.result
+        else:
+            result[:self.num_elems] = self.result.tolist()
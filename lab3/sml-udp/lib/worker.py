@@ -21,14 +21,17 @@ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 
 
-import os, sys
-from datetime import datetime
+import atexit, collections, numbers, os, signal, sys, threading, time
 
 def ip(iface="eth0"):
     """
     Retrieve the first ip address assigned to an interface
+    The result is cached, the lookup forks a shell
     """
-    return os.popen('ip addr show %s' % iface).read().split("inet ")[1].split("/")[0] # yeah, i know... right?
+    if iface not in ip.cache:
+        ip.cache[iface] = os.popen('ip addr show %s' % iface).read().split("inet ")[1].split("/")[0] # yeah, i know... right?
+    return ip.cache[iface]
+ip.cache = {}
 
 def rank():
     """
@@ -53,11 +56,150 @@ def GetRankOrExit():
         PrintUsage()
         sys.exit(1)
 
-def Log(*args):
+# Log levels, select with APP_LOG_LEVEL (name or number)
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+_LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+
+def _env_level(default=INFO):
+    level = os.environ.get("APP_LOG_LEVEL", "")
+    return _LEVELS.get(level.upper(), int(level) if level.isdigit() else default)
+
+LOG_LEVEL = _env_level()
+LOG_RING_SIZE = int(os.environ.get("APP_LOG_RING", "4096"))   # Records kept for DumpLog()
+LOG_FLUSH_LINES = 256     # Flush the output buffer after this many lines...
+LOG_FLUSH_INTERVAL = 0.5  # ...or when its oldest line is this many seconds old
+
+def _snapshot(msg, args):
+    # Arguments that may change or keep objects alive until the ring is
+    # dumped, e.g. lists or exceptions, are formatted right away
+    for arg in args:
+        if not (arg is None or isinstance(arg, (str, bytes, numbers.Number))):
+            return msg % args, ()
+    return msg, args
+
+class _Logger:
+    """
+    Leveled logger writing through a line buffer
+
+    Every record, whatever its level, is kept in a ring of the last
+    LOG_RING_SIZE records. Suppressed records stay unformatted unless they
+    carry more than numbers and strings, so debug records usually cost a
+    tuple append unless they are dumped. Records at or above LOG_LEVEL are
+    formatted and buffered, and written out in batches, on errors, by a
+    flusher thread LOG_FLUSH_INTERVAL after the first buffered line, at
+    exit and on SIGTERM
+    """
+
+    def __init__(self):
+        self.ring = collections.deque(maxlen=LOG_RING_SIZE)
+        self.lines = []
+        self.first = 0.0
+        self.prefix = None
+        # Reentrant, the SIGTERM handler may interrupt a log() holding it
+        self.lock = threading.RLock()
+        self.buffered = threading.Event()   # set while lines wait in the buffer
+        self.flusher = None
+        atexit.register(self.flush)
+        self.catch_sigterm()
+
+    def catch_sigterm(self):
+        # Flush before the default action of SIGTERM, which skips atexit,
+        # e.g. when lib.launch stops an aborted run
+        try:
+            if signal.getsignal(signal.SIGTERM) != signal.SIG_DFL:
+                return
+            signal.signal(signal.SIGTERM, self.on_sigterm)
+        except ValueError:
+            pass    # Not imported from the main thread
+
+    def on_sigterm(self, signum, frame):
+        try:
+            self.flush()
+        except RuntimeError:
+            pass    # Interrupted a write to stdout
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    def flush_loop(self):
+        # Lines logged before a long wait still come out in time
+        while True:
+            self.buffered.wait()
+            time.sleep(LOG_FLUSH_INTERVAL)
+            self.flush()
+
+    def format(self, t, msg, args):
+        if self.prefix is None:
+            # Resolve the worker identity once
+            try:
+                self.prefix = "[W][%s]" % ip()
+            except Exception:
+                self.prefix = "[W][?]"
+        if args:
+            msg = msg % args
+        return "%s[%s.%06d] %s\n" % (self.prefix, time.strftime("%H:%M:%S", time.localtime(t)),
+                                      int(t * 1000000) % 1000000, msg)
+
+    def log(self, level, msg, args):
+        t = time.time()
+        if level < LOG_LEVEL:
+            self.ring.append((t,) + _snapshot(msg, args))
+            return
+        if args:
+            msg = msg % args
+        self.ring.append((t, msg, ()))
+        line = self.format(t, msg, ())
+        with self.lock:
+            if not self.lines:
+                self.first = t
+                self.buffered.set()
+                if self.flusher is None:
+                    self.flusher = threading.Thread(target=self.flush_loop, name="log-flusher", daemon=True)
+                    self.flusher.start()
+            self.lines.append(line)
+            full = len(self.lines) >= LOG_FLUSH_LINES or t - self.first >= LOG_FLUSH_INTERVAL
+        if level >= ERROR or full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.buffered.clear()
+            if self.lines:
+                sys.stdout.write("".join(self.lines))
+                self.lines = []
+            sys.stdout.flush()
+
+    def dump(self, file):
+        self.flush()
+        file.write("".join(self.format(t, msg, args) for t, msg, args in self.ring))
+        file.flush()
+
+_logger = _Logger()
+
+def Log(msg, *args):
     """
     Log a timestamped message to stdout
+    The message is only %-formatted with `args` if it gets written
+    """
+    _logger.log(INFO, msg, args)
+
+def LogDebug(msg, *args):
+    """ Log at DEBUG level, see Log() """
+    _logger.log(DEBUG, msg, args)
+
+def LogWarning(msg, *args):
+    """ Log at WARNING level, see Log() """
+    _logger.log(WARNING, msg, args)
+
+def LogError(msg, *args):
+    """ Log at ERROR level and flush right away, see Log() """
+    _logger.log(ERROR, msg, args)
+
+def FlushLog():
+    """ Write out buffered log lines """
+    _logger.flush()
+
+def DumpLog(file=sys.stderr):
+    """
+    Write the most recent records of all levels, e.g. after a failure
     """
-    now = datetime.now()
-    ts = ('%02d:%02d:%02d.%06d' %
-          (now.hour, now.minute, now.second, now.microsecond))
-    print("[W][%s][%s]" % (ip(), ts), *args)
\ No newline at end of file
+    _logger.dump(file)
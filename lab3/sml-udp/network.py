@@ -20,9 +20,11 @@
  """
 
 from lib import config # do not import anything before this
+from lib.launch import launch, summary
 from p4app import P4Mininet
 from mininet.topo import Topo
 from mininet.cli import CLI
+import subprocess
 import os
 
 NUM_WORKERS = 3 # TODO: Make sure your program can handle larger values
@@ -55,7 +57,10 @@ class SMLTopo(Topo):
 
 def RunWorkers(net):
     """
-    Starts the workers and waits for their completion.
+    Starts the workers at once and waits for their completion.
+    Workers are pinned to a CPU each and start sending together, once all
+    of them created their sockets (see lib/launch.py). The launch times and
+    exit status of every worker are printed and saved to logs/launch.json.
     Redirects output to logs/<worker_name>.log (see lib/worker.py, Log())
     This function assumes worker i is named 'w<i>'. Feel free to modify it
     if your naming scheme is different
@@ -63,21 +68,15 @@ def RunWorkers(net):
     worker = lambda rank: "w%i" % rank
     log_file = lambda rank: os.path.join(os.environ['APP_LOGS'], "%s.log" % worker(rank))
 
-    # Build environment string
-    env_vars = []
-    for key in ['APP_LOGS', 'APP_TEST', 'APP_ROOT']:
-        if key in os.environ:
-            env_vars.append(f'{key}={os.environ[key]}')
+    def start(i, extra, preexec_fn):
+        with open(log_file(i), 'w') as log:
+            return net.get(worker(i)).popen(['python', 'worker.py', str(i)], stdout=log,
+                                            stderr=subprocess.STDOUT, preexec_fn=preexec_fn,
+                                            env=dict(os.environ, **extra))
 
-    env_string = ' '.join(env_vars)
-
-    for i in range(NUM_WORKERS):
-        # Run with environment variables set inline
-        cmd = f'{env_string} python worker.py {i} > {log_file(i)} 2>&1'
-        net.get(worker(i)).sendCmd(cmd)
-
-    for i in range(NUM_WORKERS):
-        net.get(worker(i)).waitOutput()
+    report = launch(start, NUM_WORKERS, os.environ['APP_LOGS'])
+    print(summary(report))
+    return report
 
 def RunControlPlane(net):
     """
@@ -91,6 +90,15 @@ def RunControlPlane(net):
     sw.addMulticastGroup(mgid=1, ports=worker_ports)
     print(f"Created multicast group 1 with ports: {worker_ports}")
 
+    # Address the copies of a result to the worker on each port
+    for i in range(NUM_WORKERS):
+        sw.insertTableEntry(table_name='MyEgress.result_dst',
+                            match_fields={'standard_metadata.egress_port': i + 1},
+                            action_name='MyEgress.set_result_dst',
+                            action_params={'mac': getWorkerMAC(i),
+                                           'ip': getWorkerIP(i),
+                                           'port': 10000 + i})
+
     # Configure hosts for raw socket access
     for i in range(NUM_WORKERS):
         worker = net.get(f'w{i}')
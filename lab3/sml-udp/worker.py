@@ -5,6 +5,8 @@
 from lib.gen import GenInts, GenMultipleOfInRange
 from lib.test import CreateTestData, RunIntTest
 from lib.worker import *
+from lib.codec import VectorCodec, unpack_header
+from lib.launch import wait_barrier
 import socket
 import struct
 import time
@@ -42,26 +44,6 @@ def calculate_checksum(data):
 
     return (~checksum) & 0xFFFF
 
-def pack_switchml_packet(worker_id, chunk_id, num_workers, flags, values):
-    padded_values = values + [0] * (4 - len(values))
-    padded_values = padded_values[:4]
-
-    packet = struct.pack('!BBBBLLLL',
-                        worker_id, chunk_id, num_workers, flags,
-                        padded_values[0], padded_values[1],
-                        padded_values[2], padded_values[3])
-    return packet
-
-def unpack_switchml_packet(data):
-    if len(data) < 20:
-        return None
-
-    unpacked = struct.unpack('!BBBBLLLL', data[:20])
-    worker_id, chunk_id, num_workers, flags = unpacked[:4]
-    values = list(unpacked[4:])
-
-    return (worker_id, chunk_id, num_workers, flags, values)
-
 def create_raw_udp_packet(src_ip, dst_ip, src_port, dst_port, payload, src_mac, dst_mac):
     # Ethernet header (14 bytes)
     eth_header = struct.pack('!6s6sH',
@@ -106,7 +88,7 @@ def create_raw_udp_packet(src_ip, dst_ip, src_port, dst_port, payload, src_mac,
 
 def AllReduce(rank, data, result):
     """Process ALL chunks, not just the first one"""
-    Log(f"Worker {rank}: Processing ALL chunks")
+    Log("Worker %s: Processing ALL chunks", rank)
 
     # Get network information
     src_mac = get_worker_mac(rank)
@@ -116,7 +98,7 @@ def AllReduce(rank, data, result):
     src_port = 10000 + rank
     dst_port = SWITCHML_PORT
 
-    Log(f"Worker {rank}: Processing {len(data)} values in chunks of {CHUNK_SIZE}")
+    Log("Worker %s: Processing %s values in chunks of %s", rank, len(data), CHUNK_SIZE)
 
     interface = "eth0"
 
@@ -124,9 +106,9 @@ def AllReduce(rank, data, result):
     try:
         send_sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(0x0003))
         send_sock.bind((interface, 0))
-        Log(f"Worker {rank}: Created raw send socket on {interface}")
+        Log("Worker %s: Created raw send socket on %s", rank, interface)
     except Exception as e:
-        Log(f"Worker {rank}: ERROR - Could not create raw socket: {e}")
+        LogError("Worker %s: ERROR - Could not create raw socket: %s", rank, e)
         return False
 
     # Create UDP socket for receiving
@@ -136,9 +118,9 @@ def AllReduce(rank, data, result):
         recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         recv_sock.bind(('', src_port))
         recv_sock.settimeout(10.0)  # Shorter timeout since we know it works
-        Log(f"Worker {rank}: Created UDP receive socket on port {src_port}")
+        Log("Worker %s: Created UDP receive socket on port %s", rank, src_port)
     except Exception as e:
-        Log(f"Worker {rank}: ERROR - Could not create receive socket: {e}")
+        LogError("Worker %s: ERROR - Could not create receive socket: %s", rank, e)
         send_sock.close()
         return False
 
@@ -146,88 +128,79 @@ def AllReduce(rank, data, result):
         num_workers = 3
         num_chunks = (len(data) + CHUNK_SIZE - 1) // CHUNK_SIZE  # Ceiling division
 
-        # Staggered delay based on rank
-        delay = 1.0 + (rank * 0.5)
-        Log(f"Worker {rank}: Waiting {delay} seconds before sending...")
-        time.sleep(delay)
+        # Encode the whole vector up front, results are decoded into the codec
+        codec = VectorCodec(data, CHUNK_SIZE)
+        codec.set_headers(rank, 0, num_workers)
+
+        # Start together with the other workers when launched behind a
+        # barrier (see lib/launch.py), otherwise staggered by rank
+        try:
+            released = wait_barrier(rank)
+        except TimeoutError as e:
+            LogError("Worker %s: ERROR - %s", rank, e)
+            return False
+        if released is None:
+            delay = 1.0 + (rank * 0.5)
+            Log("Worker %s: Waiting %s seconds before sending...", rank, delay)
+            time.sleep(delay)
 
         # Process each chunk
         for chunk_id in range(num_chunks):
-            start_idx = chunk_id * CHUNK_SIZE
-            end_idx = min(start_idx + CHUNK_SIZE, len(data))
-            chunk_values = data[start_idx:end_idx]
-
-            # Pad chunk to 4 values if needed
-            while len(chunk_values) < 4:
-                chunk_values.append(0)
-
-            Log(f"Worker {rank}: Sending chunk {chunk_id} with values {chunk_values}")
-
-            # Create SwitchML payload
-            switchml_payload = pack_switchml_packet(
-                worker_id=rank,
-                chunk_id=chunk_id,
-                num_workers=num_workers,
-                flags=0,
-                values=chunk_values
-            )
+            LogDebug("Worker %s: Sending chunk %s", rank, chunk_id)
 
             # Create raw packet
             raw_packet = create_raw_udp_packet(
                 src_ip, dst_ip, src_port, dst_port,
-                switchml_payload, src_mac, dst_mac
+                codec.payload(chunk_id), src_mac, dst_mac
             )
 
             # Send packet
             try:
                 bytes_sent = send_sock.send(raw_packet)
-                Log(f"Worker {rank}: Sent packet for chunk {chunk_id} ({bytes_sent} bytes)")
+                LogDebug("Worker %s: Sent packet for chunk %s (%s bytes)", rank, chunk_id, bytes_sent)
             except Exception as e:
-                Log(f"Worker {rank}: ERROR - Failed to send packet for chunk {chunk_id}: {e}")
+                LogError("Worker %s: ERROR - Failed to send packet for chunk %s: %s", rank, chunk_id, e)
                 return False
 
             # Wait for aggregation result
-            Log(f"Worker {rank}: Waiting for response to chunk {chunk_id}")
+            LogDebug("Worker %s: Waiting for response to chunk %s", rank, chunk_id)
 
             try:
                 response_data, addr = recv_sock.recvfrom(1024)
-                Log(f"Worker {rank}: Received response from {addr}")
+                LogDebug("Worker %s: Received response from %s", rank, addr)
 
                 # Unpack response
-                response = unpack_switchml_packet(response_data)
-                if response is None:
-                    Log(f"Worker {rank}: ERROR - Invalid response packet for chunk {chunk_id}")
+                response = unpack_header(response_data)
+                if response is None or len(response_data) < codec.payload_size:
+                    LogError("Worker %s: ERROR - Invalid response packet for chunk %s", rank, chunk_id)
                     return False
 
-                resp_worker_id, resp_chunk_id, resp_num_workers, resp_flags, chunk_result = response
+                resp_worker_id, resp_chunk_id, resp_num_workers, resp_flags = response
 
                 # Verify this is the response we're expecting
                 if resp_chunk_id == chunk_id and resp_flags == 1:
-                    Log(f"Worker {rank}: Received valid response for chunk {chunk_id}: {chunk_result}")
-
-                    # Copy aggregated values back to result array
-                    for i in range(min(len(chunk_values), 4)):
-                        if start_idx + i < len(result):
-                            result[start_idx + i] = chunk_result[i]
+                    LogDebug("Worker %s: Received valid response for chunk %s", rank, chunk_id)
 
-                    Log(f"Worker {rank}: Updated result indices {start_idx}-{start_idx + len(chunk_values) - 1}")
+                    # Decode aggregated values into the result vector
+                    codec.store(chunk_id, response_data)
 
                 else:
-                    Log(f"Worker {rank}: ERROR - Wrong response: chunk_id={resp_chunk_id}, flags={resp_flags}")
+                    LogError("Worker %s: ERROR - Wrong response: chunk_id=%s, flags=%s", rank, resp_chunk_id, resp_flags)
                     return False
 
             except socket.timeout:
-                Log(f"Worker {rank}: ERROR - Timeout waiting for chunk {chunk_id}")
+                LogError("Worker %s: ERROR - Timeout waiting for chunk %s", rank, chunk_id)
                 return False
             except Exception as e:
-                Log(f"Worker {rank}: ERROR - Exception receiving response for chunk {chunk_id}: {e}")
+                LogError("Worker %s: ERROR - Exception receiving response for chunk %s: %s", rank, chunk_id, e)
                 return False
 
             # Small delay between chunks to avoid overwhelming the switch
             time.sleep(0.1)
 
-        Log(f"Worker {rank}: Completed processing all {num_chunks} chunks")
-        Log(f"Worker {rank}: Final result: {result}")
+        codec.copy_to(result)
+        Log("Worker %s: Completed processing all %s chunks", rank, num_chunks)
+        LogDebug("Worker %s: Final result: %s", rank, result)
         return True
 
     finally:
@@ -247,7 +220,8 @@ def main():
     if success:
         RunIntTest("udp-iter-0", rank, data_in, True)
     else:
-        Log("AllReduce failed!")
+        LogError("AllReduce failed!")
+        DumpLog()
     Log("Done")
 
 if __name__ == '__main__':